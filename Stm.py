@@ -2,9 +2,23 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+from contextlib import contextmanager
 from datetime import datetime
 import numpy as np
 
+import batch
+import data_cache
+import datasets
+import fleet
+import history
+import jobs
+import profiling
+import quality
+import render_cache
+import store
+from aggregates import AggregateIndex
+from pipe_registry import load_registry
+
 # Set page config
 st.set_page_config(
     page_title="Farm Water Level Analysis",
@@ -54,236 +68,110 @@ st.markdown("""
 st.title("Farm Water Level Analysis")
 st.markdown("Analyze water level measurements across different farms and pipes.")
 
-# Initialize session state
-if 'processed_data' not in st.session_state:
-    st.session_state.processed_data = None
-if 'farm_list' not in st.session_state:
-    st.session_state.farm_list = []
-if 'water_levels' not in st.session_state:
-    st.session_state.water_levels = None
-
-# Function to process water level data
-def extract_pipe_code(col_name, pipe_codes):
-    for code in pipe_codes:
-        if code.lower() in col_name.lower():
-            return code
-    return col_name
-
-def process_water_level_data(water_file_path, pipe_codes):
-    """Process water level data and extract the relevant information"""
-    try:
-        # Load the CSV file
-        df = pd.read_csv(water_file_path)
-
-        # Filter relevant columns (Dates & Water Levels)
-        cols_to_keep = []
-
-        for i, col in enumerate(df.columns):
-            if "Date" in col:
-                cols_to_keep.append(col)
-            if "Water level in pipe from bottom up" in col:
-                cols_to_keep.append(col)
-            if i > 0 and "Water level" in df.columns[i]:
-                cols_to_keep.append(df.columns[i - 1])  # Include location or pipe code info
-
-        df_filtered = df[cols_to_keep]
-
-        # Rename water level columns to include pipe code
-        for i, col in enumerate(df_filtered.columns[:-1]):
-            if "Water level in pipe from bottom up - in millimeter" in col:
-                next_col = df_filtered.columns[i + 1]
-                df_filtered.columns.values[i] = next_col + " Water level in pipe from bottom up - in millimeter"
-
-        # Keep only Date & Water level columns
-        final_cols_to_keep = []
-
-        for col in df_filtered.columns:
-            if "Date" in col or "Water level in pipe from bottom up" in col:
-                final_cols_to_keep.append(col)
-
-        df_final = df_filtered[final_cols_to_keep]
-
-        # Rename water level columns using pipe codes
-        df_final.columns = [extract_pipe_code(col, pipe_codes) for col in df_final.columns]
-
-        return df_final
-    except Exception as e:
-        st.error(f"Error processing water level data: {str(e)}")
-        return None
-
-# Main processing function
-def process_data(farm_file, water_file):
-    try:
-        # Manually listed pipe codes
-        pipe_codes = [
-            "gurinder_1", "raghbir_2", "RAGHBIR_1", "Gurinder_2", "Gurdeep_1", "Gurdeep_2",
-            "Gurdeep_3", "Gurdeep_4", "Gurkirat_1", "Gurwinder_4", "Satpal_1", "Gurtej_1",
-            "Tarsem_2", "lakh_1", "sukh_1", "SATWI_1", "Jasmail_1", "manjeet_1", "MANGA_1",
-            "MANGA_2", "PARMI_1", "Gurkirat_4", "Tarsem_1", "GURIN_1", "PARWI_1", "MANDE_1",
-            "Rimp_01", "SANDE_1", "Varinder_1", "Gurkirat_2", "varinder_02", "Gurkirat_3",
-            "jasmail_2", "Baljinder_1", "Mand_1", "Bhupinder_1", "Sandeep_1", "Hira_1",
-            "RAMP_1", "TAHI_1", "PARG_1", "GURS_1", "GURD_1", "MAND_2", "Sahi_1",
-            "Harwinder_1", "Bablu_1", "Kulwinder_1", "sarb_1", "Kulwinder_2", "Nirmal_1",
-            "sarab_2", "Jaspal_1", "Jaspal_2", "Jaspal_3", "paramjit_1", "Yadwinder_1",
-            "Charan_1", "Sarb_3", "Pragh_1", "NAIB_1", "Manin_1", "Iqbal_1", "Nazar_1",
-            "Surjit_2", "Surjit_1", "Suri_1", "Sarab_4", "Gurwinder_3", "Gurwinder_2",
-            "Gurwinder_1", "Pardeep_1", "Jasveer_3", "Jasveer_2", "Jasveer_1", "Hardeep_1",
-            "Harinder_2", "Balkar_2", "BALKAR_1", "Nirbhah_1", "Jasveer_4", "Harpreet_1",
-            "Newhardeep_2", "Newhardeep_3", "Balbir_1", "Pardeep_2", "Pardeep_6", "Pardeep_3",
-            "Pardeep_4", "Pardeep_5", "Hardeep_3", "Jasveer_6", "Balkar_3", "Raj_1",
-            "Newhardeep_1", "Harinder_1", "Harjit_1", "Jasveer_5", "Harpreet_2", "Jasveer_7",
-            "Bharpur_1", "Jagd_1", "Hard_12", "Gaga_1", "Jagt_1", "Ram_1", "Satn_1",
-            "Simr_1", "Hardeep_4", "Theru_1", "Theru_2", "balwin_1", "Navjot_1", "Navjot_2",
-            "Navjot_3", "Karnail_1", "Gurpreet_1", "Rupinder_1", "Dhupinder_1", "Pritpal_1",
-            "Navjot_4", "Navjot_5", "Amrik_2", "Amrik_3", "Amrik_1", "Avtar_1", "Avtar_2",
-            "Daljinder_1", "Jagtar_1", "Daljinder_3", "Daljinder_5", "Daljinder_4",
-            "avatar_1", "avatar_3", "avatar_2", "avatar_4", "Daljinder_2", "Harpal_2",
-            "Harpal_4", "harpal_1", "avtar_12", "avtar_11", "Avtar_13", "Gurdarshan_3",
-            "gurdarshan_2", "gurdarshan_1", "mukhtiar_2", "Mukhtiar_1", "Mukhtair_3",
-            "Sukhwant_1", "Amrinder_1", "Sukhwinder_2", "Sukhwant_3", "Harjinder_2",
-            "Harjinder_1", "Kuldeep_1", "Kuldeep_2", "Gurnam_1", "gurna_2", "Didar_1",
-            "Didar_2", "Didar_3", "JAGTAR_1", "Chamkaur_1", "sharn_1", "netar_1", "Sukh_1",
-            "Jasp_1", "Jasw_1", "Gurd_1", "harb_1", "Raghuveer_1", "Raghuveer_2",
-            "Raghuveer_3", "Jaswinder_1", "Jaswinder_2", "Jaswinder_5", "Lal_1", "Lal_2",
-            "Harwinder_02", "Amar_2", "Amar_1", "hardeep_10", "RAN_1", "RANJIT_1",
-            "NAHAR_1", "jager_1", "jagdeep_1", "surjit_3", "sukh_2", "karam_1", "bhag_1",
-            "PARA_1", "paver_1", "vash_1", "Satnam_1", "Satnam_2", "Satnam_4", "SATNAM_3",
-            "Satnam_5", "Darshan_1", "Hakam_1", "Ogar_1", "satnam_1", "malkeet_1",
-            "Avatar_1", "Gamdoor_1", "harinder_1"
-        ]
-
-        # Process water level data
-        water_df = process_water_level_data(water_file, pipe_codes)
-        if water_df is None:
-            return None
-
-        # Extract Date column
-        date_col = [col for col in water_df.columns if "Date" in col][0]
-
-        # Set date column as index for transposition
-        water_df.set_index(date_col, inplace=True)
-
-        # Transpose water_df: rows become pipes, columns become dates
-        transposed = water_df.transpose()
-        transposed.reset_index(inplace=True)
-        transposed.rename(columns={'index': 'Pipe Code'}, inplace=True)
-
-        # Load farm info from Excel sheets
-        excel_file = pd.ExcelFile(farm_file)
-
-        # Load sheets with explicit column specification
-        pvc_pipes_kharif = pd.read_excel(excel_file, sheet_name='PVC Pipes Kharif24')
-        kharif_2024 = pd.read_excel(excel_file, sheet_name='Kharif 2024')
-
-        # Find sowing date column
-        sowing_column = "Kharif 24 Paddy sowing (DSR)"
-        if sowing_column not in kharif_2024.columns:
-            possible_matches = [col for col in kharif_2024.columns if "sowing" in col.lower() or "dsr" in col.lower()]
-            if possible_matches:
-                sowing_column = possible_matches[0]
-            else:
-                st.warning("Could not find sowing date column in Kharif 2024 sheet")
-                return None
-
-        # Find farm ID columns
-        farm_id_col_pvc = "Farm ID Kharif 24"
-        if farm_id_col_pvc not in pvc_pipes_kharif.columns:
-            possible_matches = [col for col in pvc_pipes_kharif.columns if "farm" in col.lower() and "id" in col.lower()]
-            if possible_matches:
-                farm_id_col_pvc = possible_matches[0]
-            else:
-                st.warning("Could not find farm ID column in PVC Pipes sheet")
-                return None
-
-        farm_id_col_kharif = "Kharif 24 FarmID"
-        if farm_id_col_kharif not in kharif_2024.columns:
-            possible_matches = [col for col in kharif_2024.columns if "farm" in col.lower() and "id" in col.lower()]
-            if possible_matches:
-                farm_id_col_kharif = possible_matches[0]
-            else:
-                st.warning("Could not find farm ID column in Kharif 2024 sheet")
-                return None
-
-        # Find pipe code column
-        pipe_code_col = "Pipe Code Kharif 24"
-        if pipe_code_col not in pvc_pipes_kharif.columns:
-            possible_matches = [col for col in pvc_pipes_kharif.columns if "pipe" in col.lower() and "code" in col.lower()]
-            if possible_matches:
-                pipe_code_col = possible_matches[0]
-            else:
-                st.warning("Could not find pipe code column in PVC Pipes sheet")
-                return None
-
-        # Ensure consistent column naming for merging
-        pvc_pipes_kharif = pvc_pipes_kharif.rename(columns={farm_id_col_pvc: 'Kharif 24 FarmID'})
-        kharif_2024 = kharif_2024.rename(columns={farm_id_col_kharif: 'Kharif 24 FarmID'})
-
-        # Merge farm info and sowing data
-        kharif_subset = kharif_2024[['Kharif 24 FarmID', sowing_column]].copy()
-
-        # Merge with pipe data
-        merged_data = pd.merge(
-            pvc_pipes_kharif,
-            kharif_subset,
-            on='Kharif 24 FarmID',
-            how='left'
-        )
-
-        # Standardize pipe codes for merging
-        merged_data[pipe_code_col] = merged_data[pipe_code_col].astype(str).str.strip().str.lower()
-        transposed['Pipe Code'] = transposed['Pipe Code'].astype(str).str.strip().str.lower()
-
-        # Merge on Pipe Code
-        final_df = pd.merge(
-            transposed,
-            merged_data[['Kharif 24 FarmID', 'Village', sowing_column, pipe_code_col]],
-            left_on='Pipe Code',
-            right_on=pipe_code_col,
-            how='inner'
-        )
+# Initialize session state; the dataset itself is shared by all sessions
+if 'dataset' not in st.session_state:
+    st.session_state.dataset = None
+if 'dataset_ref' not in st.session_state:
+    st.session_state.dataset_ref = None
+if 'data_version' not in st.session_state:
+    st.session_state.data_version = None
+if 'traces' not in st.session_state:
+    st.session_state.traces = []
+if 'job' not in st.session_state:
+    st.session_state.job = None
+
+# Traced runs kept per session for the diagnostics panel
+MAX_TRACES = 10
+
+@contextmanager
+def diagnostics(name):
+    """Trace the stages run inside this block when diagnostics are on"""
+    if not st.session_state.get('diagnostics'):
+        yield None
+        return
+    with profiling.trace(name) as trace:
+        yield trace
+    keep_trace(trace)
+
+def keep_trace(trace):
+    if trace.spans:
+        st.session_state.traces = (st.session_state.traces + [trace])[-MAX_TRACES:]
+
+# Polls the background job without rerunning the rest of the page
+@st.fragment(run_every=0.5)
+def show_job_progress(job):
+    if job.finished:
+        st.rerun()
+
+    stage = "cancelling" if job.cancelling else job.stage or "waiting for a worker"
+    st.progress(job.progress, text=f"Processing data: {stage}...")
+    if st.button("Cancel", key=f"cancel_{job.id}"):
+        job.cancel()
+
+def use_dataset(key, dataset):
+    """Point this session at a shared dataset, holding it in the cache while in use"""
+    if st.session_state.dataset_ref is not None:
+        st.session_state.dataset_ref.release()
+    ref = datasets.acquire(key, dataset)
+    st.session_state.dataset_ref = ref
+    st.session_state.dataset = ref.dataset
+    st.session_state.data_version = key
+
+def collect_job(job):
+    """Move a finished job's dataset into the session and report how it went"""
+    st.session_state.job = None
+    if st.session_state.get('diagnostics') and job.trace is not None:
+        keep_trace(job.trace)
+
+    for message in job.warnings:
+        st.warning(message)
+
+    if job.status == "done":
+        use_dataset(job.key, job.result)
+        st.success("Data processed successfully!")
+    elif job.status == "cancelled":
+        st.info("Processing cancelled")
+    else:
+        st.error(job.error)
+        st.error("Failed to process data. Please check your files.")
 
-        # Rename columns for clarity
-        final_df.rename(columns={
-            'Kharif 24 FarmID': 'Farm ID',
-            'Village': 'Location',
-            sowing_column: 'Date of Sowing',
-        }, inplace=True)
+def export_data(dataset, key, fmt):
+    """Download callback: the export file is only built when someone clicks"""
+    def read():
+        with open(store.export_file(dataset, key, fmt), 'rb') as f:
+            return f.read()
+    return read
 
-        # Convert sowing dates
-        date_formats = ['%d/%m/%Y', '%Y-%m-%d', '%m/%d/%Y', '%d-%m-%Y']
-        for fmt in date_formats:
-            try:
-                final_df['Date of Sowing'] = pd.to_datetime(final_df['Date of Sowing'], format=fmt, errors='coerce')
-                break
-            except (ValueError, TypeError):
-                continue
+# Chart backends offered in the UI; the native one skips Matplotlib entirely
+CHART_BACKENDS = ["Matplotlib", "Streamlit (fast)"]
 
-        # If all formats failed, try pandas auto-detection
-        if not pd.api.types.is_datetime64_dtype(final_df['Date of Sowing']):
-            final_df['Date of Sowing'] = pd.to_datetime(final_df['Date of Sowing'], errors='coerce')
+def show_figure(cache_key, draw):
+    """Draw a Matplotlib chart once per cache_key and show it as a PNG"""
+    png = render_cache.get(cache_key) if cache_key is not None else None
 
-        # Fill any missing dates with default
-        default_date = pd.to_datetime("16/06/2024", format="%d/%m/%Y")
-        final_df['Date of Sowing'].fillna(default_date, inplace=True)
+    if png is None:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        draw(ax)
+        plt.tight_layout()
 
-        # Normalize columns (handle duplicate column names)
-        normalized_columns = final_df.columns.to_series().apply(lambda x: x.split('.')[0])
-        merged_df = pd.DataFrame()
+        png = render_cache.render_png(fig)
+        plt.close(fig)
 
-        for col in normalized_columns.unique():
-            matching_cols = final_df.loc[:, normalized_columns == col]
-            merged_df[col] = matching_cols.bfill(axis=1).iloc[:, 0]
+        if cache_key is not None:
+            render_cache.put(cache_key, png)
 
-        return merged_df
-
-    except Exception as e:
-        st.error(f"Error processing data: {str(e)}")
-        return None
+    st.image(png)
 
 # Function to plot farm data
-def plot_farm_data(selected_farm, df, selected_pipes=None, show_weekly=False):
+def plot_farm_data(selected_farm, water_levels, selected_pipes=None, show_weekly=False,
+                   backend=CHART_BACKENDS[0], data_version=None, aggregates=None, include_flagged=False,
+                   past_seasons=None):
     # Filter data for selected farm
-    farm_data = df[df['Farm ID'] == selected_farm]
+    farm_data = water_levels[water_levels['Farm ID'] == selected_farm]
+
+    # Readings that failed the quality checks stay out unless asked for
+    if not include_flagged and 'Flagged' in farm_data:
+        farm_data = farm_data[~farm_data['Flagged']]
 
     if farm_data.empty:
         st.warning(f"No data found for farm {selected_farm}")
@@ -292,110 +180,112 @@ def plot_farm_data(selected_farm, df, selected_pipes=None, show_weekly=False):
     # Get sowing date (assuming same for all pipes in a farm)
     sowing_date = pd.to_datetime(farm_data['Date of Sowing'].iloc[0])
 
-    # Prepare data for plotting
-    pipe_data = {}
-    date_columns = [col for col in df.columns if isinstance(col, str) and col.startswith('2024')]
-
-    for _, row in farm_data.iterrows():
-        pipe_code = row['Pipe Code']
-        
-        # Skip if pipe not selected
-        if selected_pipes and pipe_code not in selected_pipes:
-            continue
-            
-        measurements = []
+    # Skip pipes that were not selected
+    if selected_pipes:
+        farm_data = farm_data[farm_data['Pipe Code'].isin(selected_pipes)]
 
-        for date_col in date_columns:
-            try:
-                measurement_date = pd.to_datetime(date_col)
-                water_level = row[date_col]
-
-                if pd.notna(water_level):
-                    days_from_sowing = (measurement_date - sowing_date).days
-                    measurements.append({
-                        'Date': measurement_date,
-                        'Days from Sowing': days_from_sowing,
-                        'Water Level': water_level
-                    })
-            except:
-                continue
-
-        if measurements:
-            pipe_data[pipe_code] = pd.DataFrame(measurements)
-
-    if not pipe_data:
+    if farm_data.empty:
         st.warning(f"No valid water level data for farm {selected_farm}")
         return
 
+    all_data = farm_data.assign(Week=(farm_data['Days from Sowing'] // 7) + 1)
+    pipe_data = dict(tuple(all_data.groupby('Pipe Code', sort=False, observed=True)))
+
     # Create plots
     st.subheader(f"Water Level Analysis for Farm {selected_farm}")
     st.caption(f"Sowing Date: {sowing_date.strftime('%Y-%m-%d')}")
-    
-# In the plot_farm_data function, replace the weekly plots section with:
+
+    # Averages and spreads come from the precomputed index, not the raw readings
+    if aggregates is None:
+        aggregates = AggregateIndex(all_data)
+    pipe_indices = aggregates.pipe_indices(selected_farm, selected_pipes)
+    summary = aggregates.summary(pipe_indices)
+
+    native = backend == CHART_BACKENDS[1]
+    overall_avg = summary['mean']
+
+    def chart_key(name, *extra):
+        # Without a data version there is nothing safe to key the image on
+        if data_version is None:
+            return None
+        return (data_version, selected_farm, tuple(sorted(pipe_data)), name) + extra
+
+    # The same farm in earlier seasons, read from the memory-mapped history
+    past = None
+    if past_seasons:
+        past = history.farm_history(selected_farm, past_seasons, 'weekly' if show_weekly else 'daily')
+    overlay = past is not None and not past.empty
+    # Versions, not just names: a season rewritten from a newer upload redraws
+    past_key = tuple(past['Version'].unique()) if overlay else ()
+
+    def draw_past_seasons(ax):
+        for season, season_avg in past.groupby('Season', sort=False):
+            ax.plot(season_avg['Bucket'], season_avg['Water Level'], alpha=0.6, label=season)
 
     if show_weekly:
         # Weekly average plots
         st.markdown("### Weekly Water Level Analysis")
-        
-        # Combine all pipe data
-        all_data = pd.concat(pipe_data.values())
-        
-        # Calculate week numbers
-        all_data['Week'] = (all_data['Days from Sowing'] // 7) + 1
-        
+
+        weekly_stats = aggregates.series('weekly', pipe_indices)
+        weekly_avg_all = weekly_stats[['Bucket', 'mean']].set_axis(['Week', 'Water Level'], axis=1)
+
         # Create two columns for weekly plots
         col1, col2 = st.columns(2)
-        
-        with col1:
+
+        with col1, profiling.stage("Chart: weekly measurements", all_data):
             # Weekly measurements scatter plot
             st.markdown("#### Weekly Measurements by Pipe")
-            fig_weekly_scatter, ax_weekly_scatter = plt.subplots(figsize=(10, 6))
-            
-            # Plot individual measurements as scatter points
-            for pipe_code, data in pipe_data.items():
-                data['Week'] = (data['Days from Sowing'] // 7) + 1
-                ax_weekly_scatter.scatter(data['Week'], data['Water Level'],
-                                        label=f'Pipe {pipe_code}', alpha=0.7)
-            
-            ax_weekly_scatter.set_xlabel('Weeks from Sowing', fontsize=12)
-            ax_weekly_scatter.set_ylabel('Water Level (mm)', fontsize=12)
-            ax_weekly_scatter.set_title(f'Weekly Measurements\nfor Farm {selected_farm}', fontsize=14)
-            ax_weekly_scatter.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-            ax_weekly_scatter.grid(True, alpha=0.3)
-            plt.tight_layout()
-            
-            st.pyplot(fig_weekly_scatter)
-            plt.close()
-        
-        with col2:
+            if native:
+                st.scatter_chart(all_data, x='Week', y='Water Level', color='Pipe Code')
+            else:
+                def draw_weekly_scatter(ax):
+                    # Plot individual measurements as scatter points
+                    for pipe_code, data in pipe_data.items():
+                        ax.scatter(data['Week'], data['Water Level'],
+                                   label=f'Pipe {pipe_code}', alpha=0.7)
+
+                    ax.set_xlabel('Weeks from Sowing', fontsize=12)
+                    ax.set_ylabel('Water Level (mm)', fontsize=12)
+                    ax.set_title(f'Weekly Measurements\nfor Farm {selected_farm}', fontsize=14)
+                    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+                    ax.grid(True, alpha=0.3)
+
+                show_figure(chart_key('weekly_scatter'), draw_weekly_scatter)
+
+        with col2, profiling.stage("Chart: weekly average", weekly_avg_all):
             # Weekly farm average plot
             st.markdown("#### Weekly Farm Average")
-            fig_weekly_avg, ax_weekly_avg = plt.subplots(figsize=(10, 6))
-            
-            # Calculate and plot weekly averages
-            weekly_avg_all = all_data.groupby('Week')['Water Level'].mean().reset_index()
-            ax_weekly_avg.scatter(weekly_avg_all['Week'], weekly_avg_all['Water Level'],
-                                color='k', s=100, label='Weekly Average')
-            
-            # Add overall average line
-            overall_avg = all_data['Water Level'].mean()
-            ax_weekly_avg.axhline(y=overall_avg, color='r', linestyle='--',
-                                label=f'Overall Average: {overall_avg:.1f} mm')
-            
-            ax_weekly_avg.set_xlabel('Weeks from Sowing', fontsize=12)
-            ax_weekly_avg.set_ylabel('Water Level (mm)', fontsize=12)
-            ax_weekly_avg.set_title(f'Weekly Averages\nfor Farm {selected_farm}', fontsize=14)
-            ax_weekly_avg.legend()
-            ax_weekly_avg.grid(True, alpha=0.3)
-            plt.tight_layout()
-            
-            st.pyplot(fig_weekly_avg)
-            plt.close()
-        
+            if native and overlay:
+                seasons_avg = pd.concat([weekly_avg_all.assign(Season='This season'),
+                                         past.drop(columns='Version').rename(columns={'Bucket': 'Week'})],
+                                        ignore_index=True)
+                st.scatter_chart(seasons_avg, x='Week', y='Water Level', color='Season', size=100)
+                st.caption(f"Overall Average: {overall_avg:.1f} mm")
+            elif native:
+                st.scatter_chart(weekly_avg_all, x='Week', y='Water Level', color='#000000', size=100)
+                st.caption(f"Overall Average: {overall_avg:.1f} mm")
+            else:
+                def draw_weekly_average(ax):
+                    ax.scatter(weekly_avg_all['Week'], weekly_avg_all['Water Level'],
+                               color='k', s=100, label='Weekly Average')
+                    if overlay:
+                        draw_past_seasons(ax)
+
+                    # Add overall average line
+                    ax.axhline(y=overall_avg, color='r', linestyle='--',
+                               label=f'Overall Average: {overall_avg:.1f} mm')
+
+                    ax.set_xlabel('Weeks from Sowing', fontsize=12)
+                    ax.set_ylabel('Water Level (mm)', fontsize=12)
+                    ax.set_title(f'Weekly Averages\nfor Farm {selected_farm}', fontsize=14)
+                    ax.legend()
+                    ax.grid(True, alpha=0.3)
+
+                show_figure(chart_key('weekly_average', past_key), draw_weekly_average)
+
         # Show weekly averages table
         st.markdown("#### Weekly Averages Summary")
-        weekly_table = all_data.groupby('Week')['Water Level'].agg(['mean', 'count', 'std']).reset_index()
-        weekly_table.columns = ['Week', 'Average (mm)', 'Measurements', 'Std Dev']
+        weekly_table = weekly_stats.set_axis(['Week', 'Average (mm)', 'Measurements', 'Std Dev'], axis=1)
         st.dataframe(weekly_table.style.format({
             'Average (mm)': '{:.1f}',
             'Std Dev': '{:.1f}'
@@ -403,77 +293,136 @@ def plot_farm_data(selected_farm, df, selected_pipes=None, show_weekly=False):
     else:
         # Daily plots
         st.markdown("### Daily Water Level Analysis")
-        
+
+        # Calculate daily averages
+        daily_stats = aggregates.series('daily', pipe_indices)
+        daily_avg = daily_stats[['Bucket', 'mean']].set_axis(['Days from Sowing', 'Water Level'], axis=1)
+
         # Create two columns for daily plots
         col1, col2 = st.columns(2)
-        
-        with col1:
+
+        with col1, profiling.stage("Chart: daily measurements", all_data):
             # Individual pipe measurements (scatter)
             st.markdown("#### Individual Pipe Measurements")
-            fig1, ax1 = plt.subplots(figsize=(10, 6))
-            
-            for pipe_code, data in pipe_data.items():
-                ax1.scatter(data['Days from Sowing'], data['Water Level'],
-                           label=f'Pipe {pipe_code}', alpha=0.7, s=100)
-
-            ax1.set_xlabel('Days from Sowing', fontsize=12)
-            ax1.set_ylabel('Water Level (mm)', fontsize=12)
-            ax1.set_title(f'Daily Measurements\nfor Farm {selected_farm}', fontsize=14)
-            ax1.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-            ax1.grid(True, alpha=0.3)
-            plt.tight_layout()
-            
-            st.pyplot(fig1)
-            plt.close()
-        
-        with col2:
+            if native:
+                st.scatter_chart(all_data, x='Days from Sowing', y='Water Level', color='Pipe Code', size=100)
+            else:
+                def draw_daily_scatter(ax):
+                    for pipe_code, data in pipe_data.items():
+                        ax.scatter(data['Days from Sowing'], data['Water Level'],
+                                   label=f'Pipe {pipe_code}', alpha=0.7, s=100)
+
+                    ax.set_xlabel('Days from Sowing', fontsize=12)
+                    ax.set_ylabel('Water Level (mm)', fontsize=12)
+                    ax.set_title(f'Daily Measurements\nfor Farm {selected_farm}', fontsize=14)
+                    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+                    ax.grid(True, alpha=0.3)
+
+                show_figure(chart_key('daily_scatter'), draw_daily_scatter)
+
+        with col2, profiling.stage("Chart: daily average", daily_avg):
             # Average water level over time
             st.markdown("#### Average Water Level Over Time")
-            fig2, ax2 = plt.subplots(figsize=(10, 6))
-            
-            # Combine all pipe data
-            all_data = pd.concat(pipe_data.values())
-
-            # Calculate daily averages
-            daily_avg = all_data.groupby('Days from Sowing')['Water Level'].mean().reset_index()
-
-            # Plot
-            ax2.scatter(daily_avg['Days from Sowing'], daily_avg['Water Level'],
-                        color='k', label='Daily Average')
-
-            # Add overall average line
-            overall_avg = all_data['Water Level'].mean()
-            ax2.axhline(y=overall_avg, color='r', linestyle='--',
-                        label=f'Overall Average: {overall_avg:.1f} mm')
-
-            ax2.set_xlabel('Days from Sowing', fontsize=12)
-            ax2.set_ylabel('Water Level (mm)', fontsize=12)
-            ax2.set_title(f'Daily Averages\nfor Farm {selected_farm}', fontsize=14)
-            ax2.legend()
-            ax2.grid(True, alpha=0.3)
-            plt.tight_layout()
-            
-            st.pyplot(fig2)
-            plt.close()
+            if native and overlay:
+                seasons_avg = pd.concat([daily_avg.assign(Season='This season'),
+                                         past.drop(columns='Version').rename(columns={'Bucket': 'Days from Sowing'})],
+                                        ignore_index=True)
+                st.scatter_chart(seasons_avg, x='Days from Sowing', y='Water Level', color='Season')
+                st.caption(f"Overall Average: {overall_avg:.1f} mm")
+            elif native:
+                st.scatter_chart(daily_avg, x='Days from Sowing', y='Water Level', color='#000000')
+                st.caption(f"Overall Average: {overall_avg:.1f} mm")
+            else:
+                def draw_daily_average(ax):
+                    ax.scatter(daily_avg['Days from Sowing'], daily_avg['Water Level'],
+                               color='k', label='Daily Average')
+                    if overlay:
+                        draw_past_seasons(ax)
+
+                    # Add overall average line
+                    ax.axhline(y=overall_avg, color='r', linestyle='--',
+                               label=f'Overall Average: {overall_avg:.1f} mm')
+
+                    ax.set_xlabel('Days from Sowing', fontsize=12)
+                    ax.set_ylabel('Water Level (mm)', fontsize=12)
+                    ax.set_title(f'Daily Averages\nfor Farm {selected_farm}', fontsize=14)
+                    ax.legend()
+                    ax.grid(True, alpha=0.3)
+
+                show_figure(chart_key('daily_average', past_key), draw_daily_average)
 
     # Show data summary
     st.markdown("### Data Summary")
     col1, col2, col3, col4 = st.columns(4)
-    
+
     with col1:
-        st.metric("Number of Pipes", len(pipe_data))
-    
+        st.metric("Number of Pipes", summary['pipes'])
+
     with col2:
-        all_data = pd.concat(pipe_data.values())
-        st.metric("Total Measurements", len(all_data))
-    
+        st.metric("Total Measurements", summary['count'])
+
     with col3:
-        overall_avg = all_data['Water Level'].mean()
         st.metric("Average Water Level (mm)", f"{overall_avg:.1f}")
-    
+
     with col4:
-        overall_std = all_data['Water Level'].std()
-        st.metric("Standard Deviation (mm)", f"{overall_std:.1f}")
+        st.metric("Standard Deviation (mm)", f"{summary['std']:.1f}")
+
+# Every farm at once, aligned on days from sowing
+def plot_fleet(fleet_matrix, selected_farm, backend=CHART_BACKENDS[0], data_version=None,
+               dry_level=fleet.AWD_DRY_LEVEL_MM, window=fleet.AWD_WINDOW_DAYS, min_cycles=fleet.AWD_MIN_CYCLES):
+    bands = fleet_matrix.percentiles()
+    outliers = fleet_matrix.outliers()
+    compliance = fleet_matrix.awd_compliance(dry_level, window, min_cycles)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Farms", len(fleet_matrix.farm_ids))
+    with col2:
+        st.metric("AWD Compliant", f"{compliance['Compliant'].mean():.0%}" if len(compliance) else "-")
+    with col3:
+        st.metric("Outlier Farms", len(outliers))
+
+    st.markdown("#### Fleet Water Level by Days from Sowing")
+    with profiling.stage("Chart: fleet bands", bands):
+        if backend == CHART_BACKENDS[1]:
+            st.line_chart(bands.set_index('Days from Sowing')[['P10', 'P25', 'P50', 'P75', 'P90']])
+        else:
+            farm_row = fleet_matrix.farm_row(selected_farm)
+
+            def draw_fleet_bands(ax):
+                days = bands['Days from Sowing']
+                ax.fill_between(days, bands['P10'], bands['P90'], color='#1f77b4', alpha=0.15,
+                                label='10th-90th percentile')
+                ax.fill_between(days, bands['P25'], bands['P75'], color='#1f77b4', alpha=0.35,
+                                label='25th-75th percentile')
+                ax.plot(days, bands['P50'], color='#1f77b4', label='Fleet median')
+                if farm_row is not None:
+                    ax.scatter(fleet_matrix.days, farm_row, color='r', s=20, label=f'Farm {selected_farm}')
+                ax.axhline(y=dry_level, color='k', linestyle=':', label=f'AWD dry level: {dry_level} mm')
+
+                ax.set_xlabel('Days from Sowing', fontsize=12)
+                ax.set_ylabel('Water Level (mm)', fontsize=12)
+                ax.set_title('Fleet Water Level Percentiles', fontsize=14)
+                ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+                ax.grid(True, alpha=0.3)
+
+            key = None if data_version is None else (data_version, 'fleet', selected_farm, dry_level)
+            show_figure(key, draw_fleet_bands)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("#### Outlier Farms")
+        if outliers.empty:
+            st.caption("No farm sits consistently away from the fleet median")
+        else:
+            st.dataframe(outliers.style.format({'Deviation (mm)': '{:+.1f}', 'Score': '{:+.2f}'}), hide_index=True)
+    with col2:
+        st.markdown("#### AWD Compliance")
+        st.dataframe(
+            compliance.sort_values(['Compliant', 'Drying Cycles'], ascending=False)
+            .style.format({'Dry Share': '{:.0%}'}),
+            hide_index=True
+        )
 
 # Sidebar for file uploads
 with st.sidebar:
@@ -483,35 +432,78 @@ with st.sidebar:
     farm_file = st.file_uploader("Upload Farm Data (Excel)", type=['xlsx'])
     water_file = st.file_uploader("Upload Water Level Data (CSV)", type=['csv'])
     
-    if st.button("Process Data"):
+    # Incremental mode: merge only what a newer export adds to the current data
+    append_only = False
+    if st.session_state.dataset is not None:
+        append_only = st.checkbox(
+            "Only add new dates to current data",
+            value=False,
+            help="Use when the CSV is a newer export of the same season and the farm file is unchanged"
+        )
+
+    # A job that finished since the last rerun hands over its result first
+    job = st.session_state.job
+    if job is not None and job.finished:
+        collect_job(job)
+        job = None
+
+    if st.button("Process Data", disabled=job is not None):
         if farm_file is not None and water_file is not None:
-            with st.spinner("Processing data..."):
-                processed_data = process_data(farm_file, water_file)
-                if processed_data is not None:
-                    st.session_state.processed_data = processed_data
-                    st.session_state.farm_list = processed_data['Farm ID'].unique().tolist()
-                    st.success("Data processed successfully!")
-                else:
-                    st.error("Failed to process data. Please check your files.")
+            # Appended results are keyed on the data they extend as well
+            previous_version = st.session_state.data_version if append_only else None
+            data_version = data_cache.dataset_key(farm_file, water_file, load_registry().codes,
+                                                  previous_version)
+            dataset = datasets.get(data_version)
+            if dataset is not None:
+                use_dataset(data_version, dataset)
+                st.success("Data processed successfully!")
+            else:
+                # Runs on a worker thread; widgets stay usable meanwhile
+                previous = st.session_state.dataset.to_frame() if append_only else None
+                job = jobs.submit_processing(farm_file, water_file, previous, data_version)
+                st.session_state.job = job
         else:
             st.warning("Please upload both files before processing")
 
+    if job is not None:
+        show_job_progress(job)
+
+    # Results written by batch.py can be opened without re-processing
+    with st.expander("Open Batch Output"):
+        store_dir = st.text_input("Batch output folder")
+        if store_dir:
+            try:
+                store_names = batch.list_store(store_dir)
+            except (OSError, ValueError) as e:
+                st.error(f"Could not read batch output: {str(e)}")
+                store_names = []
+
+            if store_names:
+                store_name = st.selectbox("Dataset", store_names)
+                if st.button("Open Dataset"):
+                    path = os.path.join(store_dir, f"{store_name}.parquet")
+                    data_version = f"{os.path.abspath(path)}:{os.path.getmtime(path)}"
+                    dataset = datasets.get(data_version)
+                    if dataset is None:
+                        dataset = datasets.share(data_version, batch.load_store_dataset(store_dir, store_name))
+                    use_dataset(data_version, dataset)
+                    st.success(f"Opened {store_name}")
+
 # Main content area
-if st.session_state.processed_data is not None:
+if st.session_state.dataset is not None:
+    dataset = st.session_state.dataset
     st.header("Analyze Farm Data")
     
     # Farm selection
     selected_farm = st.selectbox(
         "Select a Farm to Analyze",
-        options=st.session_state.farm_list,
+        options=dataset.farm_list,
         index=0,
         key="farm_selector"
     )
     
     # Get pipes for selected farm
-    farm_pipes = st.session_state.processed_data[
-        st.session_state.processed_data['Farm ID'] == selected_farm
-    ]['Pipe Code'].unique().tolist()
+    farm_pipes = dataset.pipes_for(selected_farm)
     
     # Pipe selection (multi-select)
     selected_pipes = st.multiselect(
@@ -523,25 +515,164 @@ if st.session_state.processed_data is not None:
     
     # Toggle for weekly view
     show_weekly = st.checkbox("Show Weekly View", value=False)
+
+    # Flagged readings (out of range, outliers, flatlines) are left out by default
+    include_flagged = st.checkbox("Include flagged readings", value=False)
+    aggregates = dataset.all_aggregates if include_flagged else dataset.aggregates
+    fleet_matrix = dataset.all_fleet if include_flagged else dataset.fleet
+    chart_version = f"{st.session_state.data_version}:{'all' if include_flagged else 'clean'}"
+
+    # Seasons written to the history by earlier uploads, newest first
+    current_season = store.season_of(dataset.dates) if len(dataset.dates) else None
+    other_seasons = [season for season in reversed(history.seasons()) if season != current_season]
+    past_seasons = []
+    if other_seasons:
+        past_seasons = st.multiselect("Compare with past seasons", other_seasons,
+                                      default=other_seasons[:3], key="past_seasons")
+
+    # Chart backend: Matplotlib images (cached) or Streamlit's native charts
+    chart_backend = st.radio("Chart Style", CHART_BACKENDS, horizontal=True)
     
     # Display plots
-    plot_farm_data(selected_farm, st.session_state.processed_data, 
-                  selected_pipes if selected_pipes else None, show_weekly)
+    with diagnostics(f"Charts for {selected_farm}"):
+        plot_farm_data(selected_farm, dataset.water_levels, 
+                      selected_pipes if selected_pipes else None, show_weekly,
+                      chart_backend, chart_version, aggregates, include_flagged, past_seasons)
+
+    # Per-pipe results of the checks run when the dataset was built
+    with st.expander("Data Quality"):
+        report = dataset.quality
+        cols = st.columns(len(quality.CHECKS) + 1)
+        cols[0].metric("Readings flagged", f"{int(report['Flagged'].sum()):,} of {int(report['Readings'].sum()):,}")
+        for col, check in zip(cols[1:], quality.CHECKS):
+            col.metric(check, f"{int(report[check].sum()):,}")
+        flagged_pipes = report[report['Flagged'] > 0].sort_values('Flagged Share', ascending=False)
+        if flagged_pipes.empty:
+            st.caption("No readings failed the checks")
+        else:
+            st.dataframe(flagged_pipes.style.format({'Flagged Share': '{:.0%}'}), hide_index=True)
+        st.caption(
+            f"Out of range: below 0 or above {quality.PIPE_LENGTH_MM} mm. "
+            f"Outlier: off the {quality.ROLLING_DATES}-date rolling median by more than "
+            f"{quality.OUTLIER_Z} robust SDs and {quality.MIN_OUTLIER_MM} mm. "
+            f"Flatline: {quality.FLATLINE_READINGS}+ identical non-zero readings in a row."
+        )
+
+    # Fleet-wide comparison straight from the aggregate index
+    with st.expander("Farm Leaderboard"):
+        st.dataframe(aggregates.leaderboard().style.format({
+            'Average (mm)': '{:.1f}',
+            'Std Dev': '{:.1f}'
+        }))
     
-    # Download button
-    st.download_button(
-        label="Download Processed Data (CSV)",
-        data=st.session_state.processed_data.to_csv(index=False).encode('utf-8'),
-        file_name="processed_water_level_data.csv",
-        mime="text/csv"
-    )
+    with st.expander("Fleet View"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            dry_level = st.number_input("AWD dry level (mm)", value=fleet.AWD_DRY_LEVEL_MM, step=5)
+        with col2:
+            window = st.slider("AWD window (days from sowing)", 0, 150, fleet.AWD_WINDOW_DAYS)
+        with col3:
+            min_cycles = st.number_input("Drying cycles required", min_value=1, value=fleet.AWD_MIN_CYCLES)
+        with diagnostics("Fleet view"):
+            plot_fleet(fleet_matrix, selected_farm, chart_backend, chart_version,
+                       dry_level, window, min_cycles)
+
+    # One copy per process, so this is what the server holds for all sessions
+    with st.expander("Memory Footprint"):
+        usage = dataset.memory_usage()
+        st.dataframe(pd.DataFrame({
+            'Component': list(usage),
+            'Size (MB)': [size / 1024 ** 2 for size in usage.values()]
+        }).style.format({'Size (MB)': '{:.2f}'}), hide_index=True)
+        st.caption(
+            f"Compact data: {dataset.nbytes / 1024 ** 2:.2f} MB vs "
+            f"{dataset.source_bytes / 1024 ** 2:.2f} MB as a plain DataFrame, shared by every session"
+        )
+
+        # Every dataset this server process holds, across all sessions
+        cache = datasets.stats()
+        lookups = cache['hits'] + cache['misses']
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Shared datasets", cache['datasets'], help=f"{cache['sessions']} session(s) using them")
+        col2.metric("Cache memory", f"{cache['bytes'] / 1024 ** 2:.1f} MB",
+                    help=f"Budget {cache['budget_bytes'] / 1024 ** 2:.0f} MB")
+        col3.metric("Hit rate", f"{cache['hits'] / lookups:.0%}" if lookups else "n/a",
+                    help=f"{cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions")
+        shared = datasets.entries()
+        if shared:
+            st.dataframe(pd.DataFrame({
+                'Dataset': [store.store_name(entry['key']) for entry in shared],
+                'Size (MB)': [entry['bytes'] / 1024 ** 2 for entry in shared],
+                'Sessions': [entry['sessions'] for entry in shared],
+                'Last Used': pd.to_datetime([entry['last_used'] for entry in shared], unit='s'),
+            }).style.format({'Size (MB)': '{:.2f}'}), hide_index=True)
+    
+    # Farm and date-range queries read only the matching parts of the saved results
+    saved_name = store.store_name(st.session_state.data_version)
+    if len(dataset.dates) and store.has_dataset(saved_name):
+        with st.expander("Query Saved Results"):
+            query_farms = st.multiselect("Farms (leave empty for all)", dataset.farm_list, key="query_farms")
+            first_date, last_date = pd.Timestamp(dataset.dates.min()).date(), pd.Timestamp(dataset.dates.max()).date()
+            date_range = st.date_input("Date range", value=(first_date, last_date),
+                                       min_value=first_date, max_value=last_date, key="query_dates")
+            if st.button("Load Measurements"):
+                start, end = (date_range[0], date_range[-1]) if date_range else (None, None)
+                try:
+                    rows = store.load(saved_name, query_farms or None, start, end)
+                except FileNotFoundError:
+                    # A newer upload of the same farms replaced these results
+                    st.info("These results are no longer in the store; upload the files again to query them.")
+                else:
+                    st.caption(f"{len(rows)} measurements")
+                    st.dataframe(rows, hide_index=True)
+
+    # Download buttons; the files are written on first click, not every rerun
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="Download Processed Data (CSV)",
+            data=export_data(dataset, st.session_state.data_version, 'csv'),
+            file_name="processed_water_level_data.csv",
+            mime="text/csv"
+        )
+    with col2:
+        st.download_button(
+            label="Download Processed Data (Parquet)",
+            data=export_data(dataset, st.session_state.data_version, 'parquet'),
+            file_name="processed_water_level_data.parquet",
+            mime="application/vnd.apache.parquet"
+        )
     
     # Show raw data
     if st.checkbox("Show processed data"):
-        st.dataframe(st.session_state.processed_data)
+        st.dataframe(dataset.to_frame())
 else:
     st.info("Please upload and process your data files using the sidebar controls.")
 
+# Stage timings for recent runs; tracing is skipped entirely while this is off
+with st.sidebar.expander("Diagnostics"):
+    st.checkbox("Record stage timings", key="diagnostics")
+    traces = st.session_state.traces
+    if traces:
+        run = st.selectbox(
+            "Run",
+            range(len(traces) - 1, -1, -1),
+            format_func=lambda i: f"{traces[i].name} ({traces[i].seconds:.2f}s)"
+        )
+        trace = traces[run]
+        records = pd.DataFrame(trace.records())
+        st.dataframe(pd.DataFrame({
+            'Stage': ['  ' * depth + name for depth, name in zip(records['depth'], records['stage'])],
+            'Seconds': records['seconds'],
+            'Rows': pd.to_numeric(records['rows']).astype('Int64'),
+            'Columns': pd.to_numeric(records['columns']).astype('Int64'),
+            'Memory (MB)': pd.to_numeric(records['memory_delta_bytes']) / 1024 ** 2,
+        }).style.format({'Seconds': '{:.3f}', 'Memory (MB)': '{:+.1f}'}, na_rep=''), hide_index=True)
+        st.download_button("Download log (JSON)", trace.to_json(),
+                           file_name="digiv_stages.json", mime="application/json")
+        st.download_button("Download trace (Perfetto)", trace.to_chrome_trace(),
+                           file_name="digiv_trace.json", mime="application/json")
+
 # Add some app info
 st.sidebar.markdown("---")
 st.sidebar.markdown("""
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+
+def _reduce(pipe_index, bucket, levels, n_pipes):
+    """Sum, count and squared sum of levels per (pipe, bucket), sorted by pipe"""
+    order = np.lexsort((bucket, pipe_index))
+    pipe_index, bucket, levels = pipe_index[order], bucket[order], levels[order]
+
+    if len(levels):
+        boundaries = np.flatnonzero((np.diff(pipe_index) != 0) | (np.diff(bucket) != 0)) + 1
+        starts = np.concatenate(([0], boundaries))
+        sums = np.add.reduceat(levels, starts)
+        squares = np.add.reduceat(levels * levels, starts)
+        counts = np.diff(np.append(starts, len(levels))).astype(np.int32)
+    else:
+        starts = np.empty(0, dtype=np.int64)
+        sums = squares = np.empty(0)
+        counts = np.empty(0, dtype=np.int32)
+
+    group_pipe = pipe_index[starts]
+    return {
+        'bucket': bucket[starts].astype(np.int32),
+        'sum': sums,
+        'sumsq': squares,
+        'count': counts,
+        # Rows of pipe i are offsets[i]:offsets[i + 1]
+        'offsets': np.searchsorted(group_pipe, np.arange(n_pipes + 1)),
+    }
+
+
+def _stats(sums, squares, counts):
+    """Mean and sample standard deviation from running sums"""
+    counts = counts.astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / counts
+        variance = (squares - sums * mean) / (counts - 1)
+    std = np.sqrt(np.clip(variance, 0, None))
+    std[counts < 2] = np.nan
+    return mean, std
+
+
+class AggregateIndex:
+    """Per-pipe daily and weekly sums, counts and squared sums.
+
+    Any selection of pipes is aggregated by adding up its pipes' rows, so
+    farm views, pipe subsets and the fleet leaderboard never go back to the
+    individual readings.
+    """
+
+    def __init__(self, water_levels):
+        keys = pd.MultiIndex.from_frame(water_levels[['Farm ID', 'Pipe Code']])
+        pipe_index, pipes = pd.factorize(keys)
+        n_pipes = len(pipes)
+
+        self.farm_ids = pipes.get_level_values(0).to_numpy()
+        self.pipe_codes = pipes.get_level_values(1).to_numpy()
+        self._farm_pipes = pd.Series(self.farm_ids).groupby(self.farm_ids, sort=False).indices
+
+        levels = water_levels['Water Level'].to_numpy(dtype=np.float64)
+        days = water_levels['Days from Sowing'].to_numpy(dtype=np.float64)
+
+        # Overall totals include readings without a usable sowing date
+        self.total_sum = np.bincount(pipe_index, weights=levels, minlength=n_pipes)
+        self.total_sumsq = np.bincount(pipe_index, weights=levels * levels, minlength=n_pipes)
+        self.total_count = np.bincount(pipe_index, minlength=n_pipes).astype(np.int32)
+
+        dated = ~np.isnan(days)
+        day = days[dated].astype(np.int64)
+        self.daily = _reduce(pipe_index[dated], day, levels[dated], n_pipes)
+        self.weekly = _reduce(pipe_index[dated], day // 7 + 1, levels[dated], n_pipes)
+
+    def pipe_indices(self, farm_id, pipe_codes=None):
+        """Positions of a farm's pipes, optionally limited to pipe_codes"""
+        indices = self._farm_pipes.get(farm_id, np.empty(0, dtype=np.int64))
+        if pipe_codes:
+            indices = indices[np.isin(self.pipe_codes[indices], list(pipe_codes))]
+        return indices
+
+    def series(self, kind, indices):
+        """Mean, count and std per day or week over the given pipes"""
+        table = self.daily if kind == 'daily' else self.weekly
+        offsets = table['offsets']
+        rows = np.concatenate(
+            [np.arange(offsets[i], offsets[i + 1]) for i in indices] or [np.empty(0, dtype=np.int64)]
+        )
+
+        buckets, inverse = np.unique(table['bucket'][rows], return_inverse=True)
+        sums = np.bincount(inverse, weights=table['sum'][rows], minlength=len(buckets))
+        squares = np.bincount(inverse, weights=table['sumsq'][rows], minlength=len(buckets))
+        counts = np.bincount(inverse, weights=table['count'][rows], minlength=len(buckets))
+        mean, std = _stats(sums, squares, counts)
+
+        return pd.DataFrame({
+            'Bucket': buckets,
+            'mean': mean,
+            'count': counts.astype(np.int64),
+            'std': std,
+        })
+
+    def summary(self, indices):
+        """Pipe count, measurement count, mean and std over the given pipes"""
+        total_sum = self.total_sum[indices].sum()
+        total_sumsq = self.total_sumsq[indices].sum()
+        total_count = self.total_count[indices].sum()
+        mean, std = _stats(np.array([total_sum]), np.array([total_sumsq]), np.array([total_count]))
+        return {
+            'pipes': int((self.total_count[indices] > 0).sum()),
+            'count': int(total_count),
+            'mean': float(mean[0]),
+            'std': float(std[0]),
+        }
+
+    def leaderboard(self):
+        """One row per farm with its overall statistics, highest average first"""
+        farms = pd.Index(self.farm_ids)
+        per_farm = pd.DataFrame({
+            'sum': self.total_sum,
+            'sumsq': self.total_sumsq,
+            'count': self.total_count,
+            'pipes': 1,
+        }).groupby(farms, sort=False).sum()
+
+        mean, std = _stats(per_farm['sum'].to_numpy(), per_farm['sumsq'].to_numpy(), per_farm['count'].to_numpy())
+        board = pd.DataFrame({
+            'Farm ID': per_farm.index,
+            'Pipes': per_farm['pipes'].to_numpy(),
+            'Measurements': per_farm['count'].to_numpy(),
+            'Average (mm)': mean,
+            'Std Dev': std,
+        })
+        return board.sort_values('Average (mm)', ascending=False, ignore_index=True)
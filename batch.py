@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import quality
+from pipeline import PipelineWarning, process_data, text_identifiers
+
+# Written next to the Parquet outputs; the app reads it to list datasets
+REPORT_NAME = "_batch_report.json"
+# Per-pipe data quality report written next to each dataset
+QUALITY_SUFFIX = ".quality.parquet"
+
+
+def _job_name(name):
+    return re.sub(r"[^\w.-]+", "_", str(name)).strip("_") or "dataset"
+
+
+def find_jobs(source):
+    """(name, farm_file, water_file) for every pair in a manifest or directory.
+
+    A manifest is a CSV with farm_file and water_file columns (and an
+    optional name), paths relative to the manifest. A directory is scanned
+    for subdirectories holding one .xlsx workbook and one .csv export each.
+    """
+    jobs = []
+    if os.path.isfile(source):
+        base = os.path.dirname(os.path.abspath(source))
+        manifest = pd.read_csv(source, dtype=str)
+        for _, row in manifest.iterrows():
+            farm_file = os.path.join(base, row["farm_file"])
+            water_file = os.path.join(base, row["water_file"])
+            name = row.get("name")
+            if pd.isna(name):
+                name = os.path.splitext(os.path.basename(water_file))[0]
+            jobs.append((_job_name(name), farm_file, water_file))
+        return jobs
+
+    for entry in sorted(os.scandir(source), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        files = os.listdir(entry.path)
+        workbooks = [f for f in files if f.lower().endswith(".xlsx") and not f.startswith("~$")]
+        exports = [f for f in files if f.lower().endswith(".csv")]
+        if len(workbooks) == 1 and len(exports) == 1:
+            jobs.append((
+                _job_name(entry.name),
+                os.path.join(entry.path, workbooks[0]),
+                os.path.join(entry.path, exports[0])
+            ))
+    return jobs
+
+
+def run_job(name, farm_file, water_file, output_dir):
+    """Process one pair and write it to the store; never raises"""
+    started = time.perf_counter()
+    result = {"name": name, "farm_file": farm_file, "water_file": water_file}
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", PipelineWarning)
+            df = process_data(farm_file, water_file)
+
+        path = os.path.join(output_dir, f"{name}.parquet")
+        text_identifiers(df).to_parquet(path, index=False)
+
+        # Range, outlier and flatline checks, one row per pipe
+        report = quality.quality_report(df)
+        quality_path = os.path.join(output_dir, f"{name}{QUALITY_SUFFIX}")
+        text_identifiers(report).to_parquet(quality_path, index=False)
+        result.update({
+            "status": "ok",
+            "path": os.path.basename(path),
+            "quality_path": os.path.basename(quality_path),
+            "rows": len(df),
+            "columns": len(df.columns),
+            "flagged_readings": int(report['Flagged'].sum()),
+            "warnings": sorted({str(w.message) for w in caught if issubclass(w.category, PipelineWarning)}),
+        })
+    except Exception as e:
+        result.update({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def process_batch(jobs, output_dir, workers=None):
+    """Run jobs on a process pool and write the per-file report"""
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    results = []
+    # openpyxl parsing holds the GIL, so separate processes are what scales
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, name, farm, water, output_dir) for name, farm, water in jobs]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    results.sort(key=lambda r: r["name"])
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": round(time.perf_counter() - started, 3),
+        "datasets": results,
+    }
+    with open(os.path.join(output_dir, REPORT_NAME), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def list_store(output_dir):
+    """Names of the datasets a batch run wrote successfully"""
+    with open(os.path.join(output_dir, REPORT_NAME), encoding="utf-8") as f:
+        report = json.load(f)
+    return [r["name"] for r in report["datasets"] if r["status"] == "ok"]
+
+
+def load_store_dataset(output_dir, name):
+    return pd.read_parquet(os.path.join(output_dir, f"{name}.parquet"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process many farm workbook / water level CSV pairs in parallel")
+    parser.add_argument("source", help="manifest CSV or directory of per-dataset subdirectories")
+    parser.add_argument("output_dir", help="directory for the Parquet outputs and report")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    jobs = find_jobs(args.source)
+    if not jobs:
+        print(f"No workbook/CSV pairs found in {args.source}", file=sys.stderr)
+        return 1
+
+    report = process_batch(jobs, args.output_dir, args.workers)
+    for r in report["datasets"]:
+        detail = f"{r['rows']} rows, {r['flagged_readings']} flagged" if r["status"] == "ok" else r["error"]
+        print(f"{r['name']:<30} {r['status']:<7} {r['seconds']:>8.2f}s  {detail}")
+
+    failed = sum(r["status"] != "ok" for r in report["datasets"])
+    print(f"{len(jobs) - failed}/{len(jobs)} succeeded in {report['seconds']:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import quality
+from aggregates import AggregateIndex
+from datasets import CompactDataset
+from pipe_registry import load_registry
+from pipeline import (KHARIF_SHEET, PVC_SHEET, SOWING_DATE_FORMATS, build_water_levels, date_columns,
+                      load_farm_workbook, process_data, process_water_level_data)
+
+# (farms, pipes per farm, dates) per named size
+SIZES = {
+    "small": (50, 2, 30),
+    "medium": (500, 3, 90),
+    "large": (2000, 4, 120),
+}
+
+LEVEL_HEADER = "Water level in pipe from bottom up - in millimeter"
+
+
+def pipe_codes(farms, pipes):
+    # Fixed width so no code is a prefix of another
+    return [f"farmer{farm:05d}_{pipe + 1:02d}" for farm in range(farms) for pipe in range(pipes)]
+
+
+def generate_farm_workbook(path, farms, pipes, rng):
+    """Workbook with the two sheets process_data reads"""
+    codes = pipe_codes(farms, pipes)
+    farm_ids = [f"K24-{farm:05d}" for farm in range(farms)]
+
+    pvc = pd.DataFrame({
+        "Farm ID Kharif 24": np.repeat(farm_ids, pipes),
+        "Village": np.repeat([f"Village {farm % 40}" for farm in range(farms)], pipes),
+        "Pipe Code Kharif 24": codes,
+    })
+
+    # Sowing dates in every supported format, some as Excel dates and a few unreadable
+    sowing = pd.Timestamp(2024, 6, 1) + pd.to_timedelta(rng.integers(0, 30, farms), unit="D")
+    kind = rng.integers(0, len(SOWING_DATE_FORMATS) + 2, farms)
+    dates = [
+        day.to_pydatetime() if k == len(SOWING_DATE_FORMATS)
+        else "not sown" if k > len(SOWING_DATE_FORMATS)
+        else day.strftime(SOWING_DATE_FORMATS[k])
+        for day, k in zip(sowing, kind)
+    ]
+    kharif = pd.DataFrame({"Kharif 24 FarmID": farm_ids, "Kharif 24 Paddy sowing (DSR)": dates})
+
+    with pd.ExcelWriter(path) as writer:
+        pvc.to_excel(writer, sheet_name=PVC_SHEET, index=False)
+        kharif.to_excel(writer, sheet_name=KHARIF_SHEET, index=False)
+    return codes
+
+
+def generate_water_csv(path, codes, dates, rng, readings_per_day=2, fill=0.4, start="2024-06-15"):
+    """Survey export: a photo column naming each pipe next to its level column"""
+    days = pd.date_range(start, periods=dates, freq="D").strftime("%Y-%m-%d")
+    n_rows = dates * readings_per_day
+
+    levels = rng.uniform(0, 250, (n_rows, len(codes))).round(1)
+    levels[rng.random(levels.shape) > fill] = np.nan
+
+    columns = {
+        "start": np.full(n_rows, f"{start}T08:00:00"),
+        "Date": np.repeat(days, readings_per_day),
+        "Enumerator": np.full(n_rows, "enumerator"),
+    }
+    frame = pd.DataFrame(columns)
+    blocks = [frame]
+    for i, code in enumerate(codes):
+        block = pd.DataFrame({f"{code} - Pipe photo": "", LEVEL_HEADER: levels[:, i]})
+        blocks.append(block)
+    pd.concat(blocks, axis=1).to_csv(path, index=False)
+
+
+def measure(stage, repeat):
+    """Best wall time over repeat runs, then peak traced memory of one more"""
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stage()
+        runs.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": round(min(runs), 4), "runs": [round(r, 4) for r in runs], "peak_bytes": peak}
+
+
+def run_size(name, farms, pipes, dates, repeat, charts, workdir):
+    rng = np.random.default_rng(0)
+    farm_path = os.path.join(workdir, f"{name}_farm.xlsx")
+    water_path = os.path.join(workdir, f"{name}_water.csv")
+    codes = generate_farm_workbook(farm_path, farms, pipes, rng)
+    generate_water_csv(water_path, codes, dates, rng)
+
+    pvc, _, columns = load_farm_workbook(farm_path)
+    registry = load_registry().extend(pvc[columns["pipe_code"]].tolist())
+    processed = process_data(farm_path, water_path)
+    water_levels = build_water_levels(processed)
+    labels, label_dates = date_columns(processed.columns)
+    levels = processed[labels].to_numpy(dtype=np.float64, na_value=np.nan)[:, np.argsort(label_dates)]
+
+    stages = {
+        "load_farm_workbook": lambda: load_farm_workbook(farm_path),
+        "process_water_level_data": lambda: process_water_level_data(water_path, registry),
+        "process_data": lambda: process_data(farm_path, water_path),
+        "build_water_levels": lambda: build_water_levels(processed),
+        "aggregate_index": lambda: AggregateIndex(water_levels),
+        "check_readings": lambda: quality.check_readings(levels),
+        "compact_dataset": lambda: CompactDataset(processed),
+    }
+
+    if charts:
+        # The app module renders its page on import; bare mode just logs warnings
+        import Stm
+
+        farm = water_levels["Farm ID"].iloc[0]
+        aggregates = AggregateIndex(water_levels)
+        stages["plot_farm_data"] = lambda: Stm.plot_farm_data(farm, water_levels, aggregates=aggregates)
+        stages["plot_farm_data_weekly"] = lambda: Stm.plot_farm_data(
+            farm, water_levels, show_weekly=True, aggregates=aggregates)
+
+    return {
+        "size": name,
+        "farms": farms,
+        "pipes": len(codes),
+        "dates": dates,
+        "csv_bytes": os.path.getsize(water_path),
+        "workbook_bytes": os.path.getsize(farm_path),
+        "stages": {stage: measure(fn, repeat) for stage, fn in stages.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the processing pipeline on synthetic data")
+    parser.add_argument("--size", action="append", choices=sorted(SIZES),
+                        help="dataset size to run, repeatable (default: small and medium)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is reported)")
+    parser.add_argument("--no-charts", action="store_true", help="skip the plot_farm_data stages")
+    parser.add_argument("--keep", metavar="DIR", help="write the generated inputs here instead of a temp dir")
+    parser.add_argument("--output", "-o", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore")
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.keep or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for name in args.size or ["small", "medium"]:
+            farms, pipes, dates = SIZES[name]
+            print(f"Running {name}: {farms} farms x {pipes} pipes x {dates} dates", file=sys.stderr)
+            report["results"].append(run_size(name, farms, pipes, dates, args.repeat, not args.no_charts, workdir))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import argparse
+import os
+import sys
+import time
+
+# pandas and the pipeline are imported in main(), after the arguments
+# parse, so --help and usage errors come back without that startup cost
+
+FORMATS = ("csv", "parquet")
+
+
+class OutputError(Exception):
+    """The result could not be serialised to the output file"""
+
+
+def output_format(path, requested=None):
+    if requested:
+        return requested
+    return "parquet" if path.lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def read_output(path, fmt):
+    """Load a previous run's output to append to"""
+    import pandas as pd
+
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=["Date of Sowing"])
+
+
+def write_output(df, path, fmt):
+    """Write atomically so a failed nightly run never leaves half a file"""
+    from pipeline import text_identifiers
+
+    # Parquet cannot hold a column mixing numeric and text IDs
+    df = text_identifiers(df)
+    tmp_path = f"{path}.tmp"
+    try:
+        if fmt == "parquet":
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Merge a farm workbook and a water level CSV into one row per pipe, one column per date"
+    )
+    parser.add_argument("farm_file", help="farm workbook (.xlsx)")
+    parser.add_argument("water_file", help="water level survey export (.csv)")
+    parser.add_argument("output", help="where to write the result (.csv or .parquet)")
+    parser.add_argument("--format", choices=FORMATS, help="output format (default: from the output extension)")
+    parser.add_argument("--append", action="store_true",
+                        help="merge only new dates and pipes into an existing output")
+    parser.add_argument("--long", action="store_true",
+                        help="write one row per measurement (the chart table) instead of one per pipe")
+    parser.add_argument("--registry", help="pipe code registry CSV/JSON (default: pipe_codes.csv)")
+    parser.add_argument("--quality", metavar="PATH",
+                        help="write the per-pipe data quality report here (.csv or .parquet)")
+    parser.add_argument("--trace", metavar="PATH", help="write per-stage timings as a JSON log")
+    args = parser.parse_args(argv)
+
+    if args.registry:
+        os.environ["DIGIV_PIPE_REGISTRY"] = args.registry
+
+    import warnings
+
+    import profiling
+    import quality
+    from pipeline import PipelineError, PipelineWarning, build_water_levels, process_data
+
+    fmt = output_format(args.output, args.format)
+    started = time.perf_counter()
+    try:
+        previous = None
+        if args.append and os.path.exists(args.output):
+            if args.long:
+                parser.error("--append needs the per-pipe output, not --long")
+            previous = read_output(args.output, fmt)
+
+        with warnings.catch_warnings(record=True) as caught, profiling.trace("cli") as trace:
+            warnings.simplefilter("always", PipelineWarning)
+            df = process_data(args.farm_file, args.water_file, previous)
+
+            # Range, outlier and flatline checks over the per-pipe result
+            report = None
+            if args.quality:
+                with profiling.stage("Quality checks", df):
+                    report = quality.quality_report(df)
+            if args.long:
+                with profiling.stage("Long table") as span:
+                    df = build_water_levels(df)
+                    span.set_frame(df)
+            outputs = [(df, args.output, fmt)]
+            if report is not None:
+                outputs.append((report, args.quality, output_format(args.quality)))
+            for frame, path, frame_fmt in outputs:
+                with profiling.stage(f"Write {frame_fmt}", frame):
+                    try:
+                        write_output(frame, path, frame_fmt)
+                    except (ValueError, TypeError) as e:
+                        # pyarrow's conversion errors derive from these
+                        raise OutputError(f"could not write {path}: {e}") from e
+    except (PipelineError, OutputError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    for warning in caught:
+        if issubclass(warning.category, PipelineWarning):
+            print(f"warning: {warning.message}", file=sys.stderr)
+
+    if report is not None:
+        print(f"quality: {int(report['Flagged'].sum())} of {int(report['Readings'].sum())} readings "
+              f"on {int((report['Flagged'] > 0).sum())} pipe(s) failed a check", file=sys.stderr)
+
+    if args.trace:
+        with open(args.trace, "w", encoding="utf-8") as f:
+            f.write(trace.to_json() + "\n")
+
+    print(f"Wrote {len(df)} rows x {len(df.columns)} columns to {args.output} "
+          f"in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
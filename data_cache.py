@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+# Bump whenever process_data changes the shape of its output so stale
+# snapshots are never served.
+CACHE_VERSION = "5"
+
+CACHE_DIR = os.environ.get(
+    "DIGIV_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "digiv")
+)
+MAX_DISK_BYTES = int(os.environ.get("DIGIV_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Snapshots live on disk only: in memory, datasets.share() keeps one
+# compact copy per dataset within the shared budget
+
+
+def _update_with_file(digest, file):
+    """Feed the raw bytes of an uploaded file or a path into the digest"""
+    if hasattr(file, "getvalue"):
+        # Streamlit UploadedFile / BytesIO: no need to move the read position
+        digest.update(file.getvalue())
+    elif hasattr(file, "read"):
+        position = file.tell()
+        file.seek(0)
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+        file.seek(position)
+    else:
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+
+def dataset_key(farm_file, water_file, pipe_codes, previous_key=None):
+    """Content hash of both uploads and the pipe-code list.
+
+    An append run's result depends on the data it was merged into, so
+    previous_key (that dataset's key) is hashed in too; otherwise a later
+    plain run of the same files would be served the merged frame.
+    """
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+    for file in (farm_file, water_file):
+        digest.update(b"\x00")
+        _update_with_file(digest, file)
+    digest.update(b"\x00")
+    digest.update("\n".join(pipe_codes).encode("utf-8"))
+    if previous_key is not None:
+        digest.update(b"\x00append\x00")
+        digest.update(str(previous_key).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _snapshot_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+
+def _evict_disk():
+    """Drop least recently used snapshots until the directory fits the budget"""
+    try:
+        entries = [
+            os.path.join(CACHE_DIR, name)
+            for name in os.listdir(CACHE_DIR)
+            if name.endswith(".parquet")
+        ]
+    except FileNotFoundError:
+        return
+
+    stats = []
+    for path in entries:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stats.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in stats)
+    for _, size, path in sorted(stats):
+        if total <= MAX_DISK_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def get(key):
+    """Return the cached frame for key, or None on a miss"""
+    path = _snapshot_path(key)
+    try:
+        df = pd.read_parquet(path)
+        # Touch the snapshot so eviction treats it as recently used
+        os.utime(path)
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+    return df
+
+
+def put(key, df):
+    """Snapshot df on disk when it can be serialized"""
+    path = _snapshot_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        # Mixed-type object columns cannot always be written to Parquet;
+        # such a dataset is simply processed again next time
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    _evict_disk()
+
+
+def clear():
+    """Remove every snapshot"""
+    if os.path.isdir(CACHE_DIR):
+        for name in os.listdir(CACHE_DIR):
+            if name.endswith(".parquet"):
+                os.remove(os.path.join(CACHE_DIR, name))
@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import profiling
+import quality
+from aggregates import AggregateIndex
+from fleet import FleetMatrix
+from pipeline import build_water_levels, date_columns
+
+# Memory the shared datasets may hold before unused ones are evicted.
+# Datasets a session is still using are never evicted, so the total can
+# run over while every entry is in use.
+MEMORY_BUDGET_MB = int(os.environ.get("DIGIV_SHARED_MB", 1024))
+
+# int16 readings are tenths of a millimetre; only used when that is lossless
+LEVEL_SCALE = 10
+
+_entries = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+# Re-entrant because DatasetRef releases can run from garbage collection
+_lock = threading.RLock()
+
+
+def _encode_levels(values):
+    """Scaled int16 readings plus a packed NaN mask, or float32 if that would round"""
+    missing = np.isnan(values)
+    present = values[~missing]
+    scaled = np.round(present.astype(np.float64) * LEVEL_SCALE)
+
+    fits = present.size and np.abs(scaled).max() <= np.iinfo(np.int16).max
+    if fits and np.array_equal((scaled / LEVEL_SCALE).astype(values.dtype), present):
+        levels = np.zeros(values.shape, dtype=np.int16)
+        levels[~missing] = scaled
+        return levels, np.packbits(missing, axis=1)
+    return values.astype(np.float32), None
+
+
+class CompactDataset:
+    """Read-only, memory-lean copy of a processed wide frame.
+
+    Identifier columns are categoricals, the readings one pipe x date
+    matrix and the date headers a single datetime64 axis. Build it once
+    per dataset with share() and hand the same instance to every session;
+    nothing on it should be modified in place.
+    """
+
+    def __init__(self, df):
+        self.source_bytes = int(df.memory_usage(deep=True).sum())
+        self._columns = list(df.columns)
+
+        self.date_labels, dates = date_columns(df.columns)
+        self.dates = dates.to_numpy()
+        is_date = df.columns.isin(self.date_labels)
+
+        values = df[self.date_labels].to_numpy(dtype=np.float32, na_value=np.nan)
+        self._levels, self._mask = _encode_levels(values)
+
+        info = df.loc[:, ~is_date].reset_index(drop=True)
+        text_columns = [col for col in info.columns
+                        if info[col].dtype == object or pd.api.types.is_string_dtype(info[col])]
+        self._info = info.astype({col: 'category' for col in text_columns})
+
+        for array in (self._levels, self._mask, self.dates):
+            if array is not None:
+                array.setflags(write=False)
+
+        self.farm_list = self._info['Farm ID'].unique().tolist()
+
+        with profiling.stage("Quality checks"):
+            flagged = self._check_quality()
+
+        # Chart inputs are derived once here rather than per session. The
+        # default aggregates and fleet matrix leave flagged readings out;
+        # the all_ variants keep them for comparison.
+        self._water_levels = build_water_levels(self.to_frame(), flagged)
+        clean = self._water_levels[~self._water_levels['Flagged']]
+        self.aggregates = AggregateIndex(clean)
+        self.fleet = FleetMatrix(clean)
+        self.all_aggregates = AggregateIndex(self._water_levels)
+        self.all_fleet = FleetMatrix(self._water_levels)
+        for matrix in (self.fleet, self.all_fleet):
+            matrix.values.setflags(write=False)
+
+    # Frames are handed out as shallow copies: with copy-on-write a session
+    # that modifies one gets its own data and the shared original is untouched
+    @property
+    def info(self):
+        return self._info.copy(deep=False)
+
+    @property
+    def water_levels(self):
+        return self._water_levels.copy(deep=False)
+
+    @property
+    def quality(self):
+        return self._quality.copy(deep=False)
+
+    def _check_quality(self):
+        """Run the reading checks, keep the per-pipe report, return the flag frame"""
+        self._quality, flags = quality.run_checks(self.levels(), self.dates, self._info['Farm ID'],
+                                                  self._info['Pipe Code'])
+        return pd.DataFrame(flags, columns=self.date_labels)
+
+    def levels(self, rows=slice(None)):
+        """Pipe x date float32 readings, NaN where nothing was measured"""
+        if self._mask is None:
+            return self._levels[rows]
+        values = self._levels[rows].astype(np.float32) / np.float32(LEVEL_SCALE)
+        missing = np.unpackbits(self._mask[rows], axis=1, count=self._levels.shape[1]).astype(bool)
+        values[missing] = np.nan
+        return values
+
+    def pipes_for(self, farm_id):
+        return self._info.loc[self._info['Farm ID'] == farm_id, 'Pipe Code'].unique().tolist()
+
+    def to_frame(self, rows=slice(None)):
+        """A fresh wide DataFrame in the original column order"""
+        info = self._info.iloc[rows].reset_index(drop=True)
+        readings = pd.DataFrame(self.levels(rows), columns=self.date_labels, copy=True)
+        return pd.concat([readings, info], axis=1)[self._columns]
+
+    def iter_frames(self, chunk_rows=10_000):
+        """to_frame() in row chunks, so exports never hold the whole frame"""
+        for start in range(0, max(len(self._info), 1), chunk_rows):
+            yield self.to_frame(slice(start, start + chunk_rows))
+
+    @property
+    def nbytes(self):
+        usage = self.memory_usage()
+        return usage['Readings'] + usage['Date axis'] + usage['Identifiers']
+
+    def memory_usage(self):
+        """Bytes per component, with the original frame for comparison"""
+        readings = self._levels.nbytes + (self._mask.nbytes if self._mask is not None else 0)
+        return {
+            'Readings': readings,
+            'Date axis': self.dates.nbytes,
+            'Identifiers': int(self._info.memory_usage(deep=True).sum()),
+            'Chart table': int(self._water_levels.memory_usage(deep=True).sum()),
+            'Fleet matrix': self.fleet.values.nbytes + self.all_fleet.values.nbytes,
+            'Quality report': int(self._quality.memory_usage(deep=True).sum()),
+            'Original frame': self.source_bytes,
+        }
+
+    @property
+    def total_bytes(self):
+        """Everything this instance holds, as counted against the budget"""
+        usage = self.memory_usage()
+        return sum(usage.values()) - usage['Original frame']
+
+
+class DatasetRef:
+    """A session's claim on a shared dataset; it can't be evicted while held.
+
+    Dropping the last reference to this object (a session ending, or
+    switching to another dataset) releases the claim too.
+    """
+
+    def __init__(self, key, entry):
+        self.key = key
+        self.dataset = entry['dataset']
+        self._release = weakref.finalize(self, _release, key, entry)
+
+    def release(self):
+        self._release()
+
+
+def _release(key, entry):
+    # Also runs from the garbage collector, so it only counts; eviction
+    # waits for the next insert
+    with _lock:
+        # After clear() the key may name a newer entry this ref never held
+        if _entries.get(key) is entry:
+            entry['sessions'] -= 1
+
+
+def _evict():
+    """Drop least recently used datasets nobody holds until under budget"""
+    budget = MEMORY_BUDGET_MB * 1024 ** 2
+    for key in [key for key, entry in _entries.items() if entry['sessions'] == 0]:
+        if sum(entry['bytes'] for entry in _entries.values()) <= budget:
+            break
+        del _entries[key]
+        _stats['evictions'] += 1
+
+
+def get(key):
+    """Return the shared dataset for key, or None"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats['misses'] += 1
+            return None
+        _stats['hits'] += 1
+        _entries.move_to_end(key)
+        entry['used'] = time.time()
+        return entry['dataset']
+
+
+def _insert(key, dataset, sessions=0):
+    entry = _entries.get(key)
+    if entry is None:
+        entry = _entries[key] = {'dataset': dataset, 'bytes': dataset.total_bytes,
+                                 'sessions': 0, 'used': time.time()}
+    entry['sessions'] += sessions
+    _entries.move_to_end(key)
+    _evict()
+    return entry
+
+
+def share(key, df):
+    """Compact df once per key and return the instance all sessions use"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            return entry['dataset']
+
+    dataset = CompactDataset(df)
+    with _lock:
+        # Another session may have finished the same dataset first
+        return _insert(key, dataset)['dataset']
+
+
+def acquire(key, dataset):
+    """Hold dataset for a session, putting it back if it was evicted meanwhile"""
+    with _lock:
+        entry = _insert(key, dataset, sessions=1)
+        entry['used'] = time.time()
+        return DatasetRef(key, entry)
+
+
+def stats():
+    """Hit/miss counts and memory held, for the cache as a whole"""
+    with _lock:
+        held = sum(entry['bytes'] for entry in _entries.values())
+        return {
+            **_stats,
+            'datasets': len(_entries),
+            'sessions': sum(entry['sessions'] for entry in _entries.values()),
+            'bytes': held,
+            'budget_bytes': MEMORY_BUDGET_MB * 1024 ** 2,
+        }
+
+
+def entries():
+    """One row per shared dataset, least recently used first"""
+    with _lock:
+        return [
+            {'key': key, 'bytes': entry['bytes'], 'sessions': entry['sessions'], 'last_used': entry['used']}
+            for key, entry in _entries.items()
+        ]
+
+
+def clear():
+    """Forget every dataset; sessions keep the instances they already hold"""
+    with _lock:
+        _entries.clear()
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Bands drawn around the fleet median
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# AWD: a field counts as dried out once the pipe reading falls to this level
+AWD_DRY_LEVEL_MM = 50
+# Days after sowing over which drying cycles are expected
+AWD_WINDOW_DAYS = (15, 90)
+# Drying cycles needed within the window to count as practising AWD
+AWD_MIN_CYCLES = 2
+
+# Robust z-score above which a farm is reported as an outlier
+OUTLIER_THRESHOLD = 2.0
+
+
+class FleetMatrix:
+    """Mean water level per farm per day from sowing, one row per farm.
+
+    Built in a single bincount pass over the chart table, whose "Days from
+    Sowing" already aligns each farm's readings to its own sowing date.
+    """
+
+    def __init__(self, water_levels):
+        dated = water_levels[water_levels['Days from Sowing'].notna()]
+        farm_index, farms = pd.factorize(dated['Farm ID'])
+        # Readings without a Farm ID (factorized to -1) belong to no farm row
+        has_farm = farm_index >= 0
+        farm_index = farm_index[has_farm]
+        days = dated['Days from Sowing'].to_numpy(dtype=np.int64)[has_farm]
+        levels = dated['Water Level'].to_numpy(dtype=np.float64)[has_farm]
+
+        self.farm_ids = np.asarray(farms, dtype=object)
+        first_day = int(days.min()) if len(days) else 0
+        n_days = int(days.max()) - first_day + 1 if len(days) else 0
+        self.days = np.arange(first_day, first_day + n_days)
+
+        flat = farm_index * n_days + (days - first_day)
+        size = len(self.farm_ids) * n_days
+        sums = np.bincount(flat, weights=levels, minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.values = (sums / counts).reshape(len(self.farm_ids), n_days)
+
+    def farm_row(self, farm_id):
+        """Daily means for one farm, or None if it has no dated readings"""
+        matches = np.flatnonzero(self.farm_ids == farm_id)
+        return self.values[matches[0]] if len(matches) else None
+
+    def _days_with_data(self):
+        # Reducing only these days avoids NumPy's all-NaN slice warnings
+        return ~np.isnan(self.values).all(axis=0)
+
+    def percentiles(self, q=PERCENTILES):
+        """Fleet percentiles of the daily farm means, one row per day"""
+        has_data = self._days_with_data()
+        bands = np.full((len(q), len(self.days)), np.nan)
+        bands[:, has_data] = np.nanpercentile(self.values[:, has_data], q, axis=0)
+        table = pd.DataFrame(bands.T, columns=[f'P{p}' for p in q])
+        table.insert(0, 'Days from Sowing', self.days)
+        table['Farms'] = (~np.isnan(self.values)).sum(axis=0)
+        return table
+
+    def outliers(self, threshold=OUTLIER_THRESHOLD):
+        """Farms whose levels sit consistently away from the fleet median"""
+        has_data = self._days_with_data()
+        median = np.full(len(self.days), np.nan)
+        median[has_data] = np.nanmedian(self.values[:, has_data], axis=0)
+        deviation = self.values - median
+
+        # Scaled median absolute deviation: a standard deviation that ignores outliers
+        spread = np.full(len(self.days), np.nan)
+        spread[has_data] = 1.4826 * np.nanmedian(np.abs(deviation[:, has_data]), axis=0)
+        spread[spread == 0] = np.nan
+
+        # A farm's score is its typical (median) daily z-score, so a few odd days don't flag it
+        z = deviation / spread
+        scored = ~np.isnan(z).all(axis=1)
+        score = np.full(len(self.farm_ids), np.nan)
+        score[scored] = np.nanmedian(z[scored], axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_deviation = np.nansum(deviation, axis=1) / (~np.isnan(deviation)).sum(axis=1)
+
+        table = pd.DataFrame({
+            'Farm ID': self.farm_ids,
+            'Days': (~np.isnan(self.values)).sum(axis=1),
+            'Deviation (mm)': mean_deviation,
+            'Score': score,
+        })
+        table['Direction'] = np.where(table['Score'] > 0, 'wetter', 'drier')
+        flagged = table[table['Score'].abs() > threshold]
+        return flagged.sort_values('Score', key=np.abs, ascending=False, ignore_index=True)
+
+    def awd_compliance(self, dry_level=AWD_DRY_LEVEL_MM, window=AWD_WINDOW_DAYS, min_cycles=AWD_MIN_CYCLES):
+        """Dry days and wet-to-dry cycles per farm within the AWD window"""
+        in_window = (self.days >= window[0]) & (self.days <= window[1])
+        values = self.values[:, in_window]
+        observed = ~np.isnan(values)
+
+        # Carry the last reading over unobserved days so gaps don't split cycles
+        last_seen = np.where(observed, np.arange(values.shape[1]), 0)
+        np.maximum.accumulate(last_seen, axis=1, out=last_seen)
+        carried = np.take_along_axis(values, last_seen, axis=1)
+        dry = carried <= dry_level
+
+        started_drying = np.diff(np.pad(dry, ((0, 0), (1, 0))).astype(np.int8), axis=1) == 1
+        cycles = started_drying.sum(axis=1)
+        dry_days = (dry & observed).sum(axis=1)
+        days = observed.sum(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dry_share = dry_days / days
+        return pd.DataFrame({
+            'Farm ID': self.farm_ids,
+            'Days Observed': days,
+            'Dry Days': dry_days,
+            'Dry Share': dry_share,
+            'Drying Cycles': cycles,
+            'Compliant': cycles >= min_cycles,
+        })
+
@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from store import season_of
+
+# One pipe x date matrix per season, opened memory-mapped so past seasons
+# cost no memory until their rows are read; override with DIGIV_HISTORY_DIR
+HISTORY_DIR = os.environ.get(
+    "DIGIV_HISTORY_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "digiv", "history")
+)
+INDEX_FILE = "index.json"
+
+_lock = threading.Lock()
+
+
+def load_index(root=HISTORY_DIR):
+    """Seasons on disk with each upload's farm and pipe row offsets"""
+    try:
+        with open(os.path.join(root, INDEX_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"seasons": {}}
+
+
+def _season_order(season):
+    # "kharif-2024" before "rabi-2024", which runs into 2025
+    kind, _, year = season.rpartition('-')
+    return year, kind != 'kharif', kind
+
+
+def seasons(root=HISTORY_DIR):
+    """Stored seasons, oldest first"""
+    return sorted(load_index(root)["seasons"], key=_season_order)
+
+
+def _season_matrix(water_levels):
+    """Pipes sorted by farm, their sowing dates, the date axis and the level matrix"""
+    long = water_levels.astype({'Farm ID': str, 'Pipe Code': str})
+    pipes = (long.drop_duplicates(subset=['Farm ID', 'Pipe Code'])
+             .sort_values('Farm ID', kind='stable')
+             .reset_index(drop=True))
+
+    rows = pd.MultiIndex.from_frame(pipes[['Farm ID', 'Pipe Code']]).get_indexer(
+        pd.MultiIndex.from_frame(long[['Farm ID', 'Pipe Code']]))
+    days = long['Date'].to_numpy().astype('datetime64[D]')
+    dates = np.unique(days)
+    cols = np.searchsorted(dates, days)
+
+    levels = np.full((len(pipes), len(dates)), np.nan, dtype=np.float32)
+    values = long['Water Level'].to_numpy(dtype=np.float32)
+    if 'Flagged' in long:
+        # Past seasons are compared against, so they hold checked readings only
+        values = np.where(long['Flagged'].to_numpy(dtype=bool), np.float32(np.nan), values)
+    levels[rows, cols] = values
+
+    sowing = pipes['Date of Sowing'].to_numpy().astype('datetime64[D]')
+    return pipes, sowing, dates, levels
+
+
+def _uploads(entry):
+    """Uploads of a season, oldest first; older indexes held one per season"""
+    if "uploads" in entry:
+        return entry["uploads"]
+    return [entry] if entry else []
+
+
+def add_season(dataset, source, season=None, root=HISTORY_DIR):
+    """Write a shared dataset's readings as one upload of its season.
+
+    Each village is uploaded on its own, so a season holds one upload per
+    source; a new upload only replaces the earlier ones whose farms it all
+    covers (a re-upload or append run of the same village). A source
+    already written is left alone. Returns the season name, or None with
+    no readings.
+    """
+    water_levels = dataset.water_levels
+    if water_levels.empty:
+        return None
+    season = season or season_of(water_levels['Date'])
+
+    with _lock:
+        index = load_index(root)
+        uploads = _uploads(index["seasons"].get(season, {}))
+        if any(upload.get("source") == source for upload in uploads):
+            return season
+
+        # Every write goes to a fresh directory and only the index rename
+        # below publishes it, so readers see either all old or all new files
+        pipes, sowing, dates, levels = _season_matrix(water_levels)
+        version = f"{season}.{uuid.uuid4().hex[:12]}"
+        directory = os.path.join(root, version)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, "levels.npy"), levels)
+        np.save(os.path.join(directory, "dates.npy"), dates)
+        np.save(os.path.join(directory, "sowing.npy"), sowing)
+
+        # Pipes are sorted by farm, so each farm is one contiguous row range
+        farm_ids, starts, counts = np.unique(pipes['Farm ID'].to_numpy(), return_index=True, return_counts=True)
+        farms = {farm: [int(start), int(start + count)] for farm, start, count in zip(farm_ids, starts, counts)}
+        kept = [upload for upload in uploads if not set(upload.get("farms", {})) <= set(farms)]
+        retired = [upload.get("version", season) for upload in uploads if upload not in kept]
+        kept.append({
+            "source": source,
+            "version": version,
+            "rows": len(pipes),
+            "dates": len(dates),
+            "farms": farms,
+            "pipes": {pipe: row for row, pipe in enumerate(pipes['Pipe Code'])},
+        })
+        index["seasons"][season] = {"uploads": kept, "retired": retired}
+        tmp_path = os.path.join(root, f"{INDEX_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(root, INDEX_FILE))
+
+        # Versions this write replaced stay for readers that loaded the old
+        # index a moment ago; anything replaced earlier goes
+        live = {upload["version"] for upload in kept} | set(retired)
+        for name in os.listdir(root):
+            if name.startswith(f"{season}.") and name not in live and os.path.isdir(os.path.join(root, name)):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return season
+
+
+def open_season(version, root=HISTORY_DIR):
+    """Memory-mapped levels plus the date axis and per-row sowing dates"""
+    directory = os.path.join(root, version)
+    levels = np.load(os.path.join(directory, "levels.npy"), mmap_mode="r")
+    dates = np.load(os.path.join(directory, "dates.npy"))
+    sowing = np.load(os.path.join(directory, "sowing.npy"))
+    return levels, dates, sowing
+
+
+def farm_history(farm_id, season_names=None, bucket='daily', root=HISTORY_DIR):
+    """Farm average per day (or week) from sowing in each stored season.
+
+    Only the farm's rows are read from each memory-mapped matrix. Version
+    names the files each season was read from, which change when the
+    farm's village is uploaded again.
+    """
+    index = load_index(root)["seasons"]
+    frames = []
+    for season in season_names if season_names is not None else sorted(index, key=_season_order):
+        # The newest upload holding the farm, usually its village's only one
+        upload = next((upload for upload in reversed(_uploads(index.get(season, {})))
+                       if str(farm_id) in upload.get("farms", {})), None)
+        if upload is None:
+            continue
+        version = upload.get("version", season)
+        try:
+            levels, dates, sowing = open_season(version, root)
+        except FileNotFoundError:
+            # Rewritten twice since this index was read; skip it this time
+            continue
+        start, stop = upload["farms"][str(farm_id)]
+        block = levels[start:stop]
+
+        days = (dates[None, :] - sowing[start:stop, None]).astype(np.int64)
+        observed = ~np.isnan(block)
+        days = days[observed]
+        if bucket == 'weekly':
+            days = days // 7 + 1
+        first = days.min() if len(days) else 0
+        sums = np.bincount(days - first, weights=block[observed])
+        counts = np.bincount(days - first)
+        has_data = counts > 0
+        frames.append(pd.DataFrame({
+            'Season': season,
+            'Version': version,
+            'Bucket': np.flatnonzero(has_data) + first,
+            'Water Level': sums[has_data] / counts[has_data],
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=['Season', 'Version', 'Bucket', 'Water Level'])
+    return pd.concat(frames, ignore_index=True)
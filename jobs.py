@@ -0,0 +1,162 @@
+import contextvars
+import io
+import os
+import threading
+import uuid
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import data_cache
+import datasets
+import history
+import profiling
+import store
+from pipeline import PipelineError, PipelineWarning, process_data
+
+# Processing runs off the script thread so reruns neither block on nor restart it
+MAX_WORKERS = int(os.environ.get("DIGIV_JOB_WORKERS", 2))
+
+# Top-level stages of a processing job, in order, for the progress bar
+PROCESS_STAGES = [
+    "Cache lookup", "Excel parsing", "Pipe registry", "CSV parsing", "Transpose",
+    "Merge farm sheets", "Merge pipes", "Sowing dates", "Same-day readings", "Coalesce columns",
+    "Save to store", "Compact dataset", "Save history",
+]
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="digiv-job")
+_current_job = contextvars.ContextVar("digiv_job", default=None)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Pipeline warnings raised on a job thread go to that job instead of stderr.
+# Routing by context variable keeps concurrent jobs apart, which
+# warnings.catch_warnings (process-global) cannot do.
+_show_warning = warnings.showwarning
+
+
+def _route_warning(message, category, filename, lineno, file=None, line=None):
+    job = _current_job.get()
+    if job is not None and issubclass(category, PipelineWarning):
+        job.warnings.append(str(message))
+        return
+    _show_warning(message, category, filename, lineno, file, line)
+
+
+warnings.showwarning = _route_warning
+warnings.filterwarnings("always", category=PipelineWarning)
+
+
+class Job:
+    """A background run with its current stage, outcome and captured warnings"""
+
+    def __init__(self, name, stages, key=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        # What the result is filed under, e.g. the dataset key
+        self.key = key
+        self.stages = stages
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.warnings = []
+        self.trace = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancelling(self):
+        return self._cancel.is_set() and not self.finished
+
+    def cancel(self):
+        """Stop the job at its next stage boundary (or before it starts)"""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.status = "cancelled"
+
+    def _on_stage(self, span):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if span.depth == 0:
+            self.stage = span.name
+            if span.name in self.stages:
+                self.progress = self.stages.index(span.name) / len(self.stages)
+
+    def _run(self, fn, args):
+        if self._cancel.is_set():
+            self.status = "cancelled"
+            return
+        self.status = "running"
+        _current_job.set(self)
+        try:
+            with profiling.trace(self.name, self._on_stage) as trace:
+                self.trace = trace
+                self.result = fn(*args)
+            self.progress = 1.0
+            self.status = "done"
+        except JobCancelled:
+            self.status = "cancelled"
+        except PipelineError as e:
+            self.error = str(e)
+            self.status = "failed"
+        except Exception as e:
+            self.error = f"Error processing data: {str(e)}"
+            self.status = "failed"
+
+
+def submit(name, fn, *args, stages=(), key=None):
+    """Run fn(*args) on the worker pool and return its Job right away"""
+    job = Job(name, list(stages), key)
+    # Each job gets a fresh context so its trace and warnings stay its own
+    job._future = _executor.submit(contextvars.copy_context().run, job._run, fn, args)
+    return job
+
+
+def load_dataset(farm_file, water_file, previous, key):
+    """Shared compact dataset for the uploads, reusing cached results.
+
+    With previous, only the dates and pipes the upload adds are processed
+    and merged into it.
+    """
+    with profiling.stage("Cache lookup"):
+        processed = data_cache.get(key)
+    if processed is None:
+        processed = process_data(farm_file, water_file, previous)
+        data_cache.put(key, processed)
+
+    name = store.store_name(key)
+    if not store.has_dataset(name):
+        with profiling.stage("Save to store"):
+            try:
+                store.write_dataset(processed, name)
+            except Exception as e:
+                # The store is for later queries; the upload itself still succeeded
+                warnings.warn(f"Could not save results to the store: {e}", PipelineWarning)
+
+    with profiling.stage("Compact dataset", processed):
+        dataset = datasets.share(key, processed)
+
+    # Later seasons overlay this one from the memory-mapped history
+    with profiling.stage("Save history"):
+        try:
+            history.add_season(dataset, name)
+        except Exception as e:
+            warnings.warn(f"Could not add this season to the history: {e}", PipelineWarning)
+    return dataset
+
+
+def submit_processing(farm_file, water_file, previous, key):
+    """Process uploads in the background; the files are copied first"""
+    # Uploaded files are shared with the script thread, so hand the job its own
+    farm_copy = io.BytesIO(farm_file.getvalue())
+    water_copy = io.BytesIO(water_file.getvalue())
+    return submit("Process Data", load_dataset, farm_copy, water_copy, previous, key,
+                  stages=PROCESS_STAGES, key=key)
@@ -0,0 +1,91 @@
+import json
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+from pipe_resolver import get_resolver
+
+# Sidecar list of known pipes; override with DIGIV_PIPE_REGISTRY
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipe_codes.csv")
+
+
+def normalize_code(code):
+    """Lookup key for a pipe code: whitespace-stripped and case-folded"""
+    return str(code).strip().casefold()
+
+
+def normalize_codes(series):
+    """Vectorized normalize_code for a pandas Series"""
+    return series.astype(str).str.strip().str.casefold()
+
+
+class PipeRegistry:
+    """Known pipe codes and their normalized lookup keys.
+
+    The resolver matches survey columns to codes; keys gives the form both
+    sides of the pipe merge in process_data are joined on. Pipes are
+    matched to farms by the PVC sheet, so no farm IDs are kept here.
+    """
+
+    def __init__(self, codes):
+        self.codes = []
+        self.keys = {}
+        for code in codes:
+            if pd.isna(code) or not str(code).strip():
+                continue
+            code = str(code).strip()
+            if code not in self.keys:
+                self.codes.append(code)
+                self.keys[code] = normalize_code(code)
+
+        self.resolver = get_resolver(self.codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return str(code).strip() in self.keys
+
+    def normalize(self, codes):
+        """Lookup keys for a Series of codes; codes not in the registry are normalized here"""
+        keys = codes.map(self.keys)
+        unknown = keys.isna()
+        if unknown.any():
+            keys[unknown] = normalize_codes(codes[unknown])
+        return keys
+
+    def extend(self, codes):
+        """New registry with extra codes appended (existing entries win)"""
+        extra = tuple(str(code).strip() for code in codes if not pd.isna(code))
+        return _compiled(tuple(self.codes) + extra)
+
+
+@lru_cache(maxsize=16)
+def _compiled(codes):
+    return PipeRegistry(list(codes))
+
+
+def _read_registry_file(path):
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        # Accept ["code", ...], {"code": ...} or [{"Pipe Code": ...}]; other fields are ignored
+        if isinstance(data, dict):
+            return pd.DataFrame({"Pipe Code": list(data.keys())})
+        if data and isinstance(data[0], dict):
+            return pd.DataFrame(data)
+        return pd.DataFrame({"Pipe Code": data})
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+@lru_cache(maxsize=4)
+def _load_file(path, mtime):
+    df = _read_registry_file(path)
+    return PipeRegistry([]).extend(df["Pipe Code"].tolist())
+
+
+def load_registry(path=None):
+    """Load a sidecar CSV/JSON registry, recompiling only when the file changes"""
+    path = path or os.environ.get("DIGIV_PIPE_REGISTRY", DEFAULT_REGISTRY_PATH)
+    return _load_file(os.path.abspath(path), os.path.getmtime(path))
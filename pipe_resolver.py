@@ -0,0 +1,128 @@
+from collections import deque
+from functools import lru_cache
+
+MAX_MEMO_ENTRIES = 100_000
+
+
+class PipeCodeResolver:
+    """Map column names to pipe codes in one pass over each name.
+
+    The codes are compiled once into an Aho-Corasick automaton over their
+    case-folded form. A name resolves to the longest code it contains;
+    among case variants of that code (``sukh_1`` / ``Sukh_1``) the one
+    spelled exactly as in the name wins. Names that still match more than
+    one code are reported by ``resolve_columns``.
+    """
+
+    def __init__(self, pipe_codes):
+        self.pipe_codes = list(pipe_codes)
+
+        # Case-folded code -> original spellings, in list order
+        self._variants = {}
+        for code in self.pipe_codes:
+            self._variants.setdefault(code.casefold(), []).append(code)
+        self._order = {code: i for i, code in reversed(list(enumerate(self.pipe_codes)))}
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._terminal = [None]
+        self._output = [0]
+        for folded in self._variants:
+            self._insert(folded)
+        self._link()
+
+        # Column names repeat across uploads of the same export schema
+        self._memo = {}
+
+    def _insert(self, folded):
+        node = 0
+        for char in folded:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._output.append(0)
+                self._goto[node][char] = nxt
+            node = nxt
+        self._terminal[node] = folded
+
+    def _link(self):
+        """Breadth-first pass filling failure and output links"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            # Output link: nearest node on the failure chain ending a code
+            fail = self._fail[node]
+            self._output[node] = fail if self._terminal[fail] is not None else self._output[fail]
+            for char, child in self._goto[node].items():
+                state = fail
+                while state and char not in self._goto[state]:
+                    state = self._fail[state]
+                target = self._goto[state].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                queue.append(child)
+
+    def matches(self, text):
+        """Longest case-folded codes contained in text"""
+        best_length = 0
+        best = []
+        node = 0
+        for char in text.casefold():
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            # Longest code ending here is this node's own, else its output link
+            hit = node if self._terminal[node] is not None else self._output[node]
+            if hit:
+                folded = self._terminal[hit]
+                if len(folded) > best_length:
+                    best_length = len(folded)
+                    best = [folded]
+                elif len(folded) == best_length and folded not in best:
+                    best.append(folded)
+        return best
+
+    def candidates(self, col_name):
+        """Pipe codes col_name could refer to, best first"""
+        cached = self._memo.get(col_name)
+        if cached is not None:
+            return cached
+
+        candidates = [code for folded in self.matches(col_name) for code in self._variants[folded]]
+
+        # Prefer spellings that appear verbatim in the column name
+        exact = [code for code in candidates if code in col_name]
+        candidates = sorted(exact or candidates, key=self._order.__getitem__)
+        if len(self._memo) < MAX_MEMO_ENTRIES:
+            self._memo[col_name] = candidates
+        return candidates
+
+    def resolve(self, col_name):
+        """Pipe code for col_name, or col_name itself if none matches"""
+        candidates = self.candidates(col_name)
+        return candidates[0] if candidates else col_name
+
+    def resolve_columns(self, columns):
+        """Resolve every column; also return {column: candidates} for ambiguous ones"""
+        resolved = []
+        ambiguous = {}
+        for col in columns:
+            candidates = self.candidates(col)
+            # Case variants are one pipe once codes are case-folded for the merge
+            if len({code.casefold() for code in candidates}) > 1:
+                ambiguous[col] = candidates
+            resolved.append(candidates[0] if candidates else col)
+        return resolved, ambiguous
+
+
+@lru_cache(maxsize=8)
+def _compiled(pipe_codes):
+    return PipeCodeResolver(pipe_codes)
+
+
+def get_resolver(pipe_codes):
+    """Process-wide resolver for a pipe-code list, compiled on first use"""
+    return _compiled(tuple(pipe_codes))
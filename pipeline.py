@@ -0,0 +1,546 @@
+import datetime
+import importlib.util
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from pipe_registry import load_registry
+
+
+class PipelineError(ValueError):
+    """The input files do not have the shape the pipeline expects"""
+
+
+class PipelineWarning(UserWarning):
+    """Something in the input had to be guessed at; processing carried on"""
+
+
+# Rows per chunk when streaming the water level CSV
+WATER_CSV_CHUNKSIZE = 50_000
+
+def rewind(file):
+    """Move an uploaded file back to the start so it can be read again"""
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return file
+
+def read_water_level_columns(water_file_path, header, positions):
+    """Read only the given header positions of the CSV, chunk by chunk"""
+    usecols = sorted(set(positions))
+    dtypes = {
+        header[i]: 'float32' if "Water level in pipe from bottom up" in header[i] else str
+        for i in usecols
+    }
+
+    try:
+        chunks = pd.read_csv(rewind(water_file_path), usecols=usecols, dtype=dtypes,
+                             chunksize=WATER_CSV_CHUNKSIZE)
+        return pd.concat(chunks, ignore_index=True)
+    except ValueError:
+        # Free text in a level column: read it as text and coerce per chunk
+        text_dtypes = {col: str for col in dtypes}
+        chunks = pd.read_csv(rewind(water_file_path), usecols=usecols, dtype=text_dtypes,
+                             chunksize=WATER_CSV_CHUNKSIZE)
+        frames = []
+        for chunk in chunks:
+            for col, dtype in dtypes.items():
+                if dtype == 'float32':
+                    chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float32')
+            frames.append(chunk)
+        return pd.concat(frames, ignore_index=True)
+
+# Function to process water level data
+def process_water_level_data(water_file_path, registry):
+    """Process water level data and extract the relevant information"""
+    try:
+        # Work out the needed columns from the header alone
+        header = list(pd.read_csv(rewind(water_file_path), nrows=0).columns)
+
+        # Filter relevant columns (Dates & Water Levels), by header position
+        positions = []
+
+        for i, col in enumerate(header):
+            if "Date" in col:
+                positions.append(i)
+            if "Water level in pipe from bottom up" in col:
+                positions.append(i)
+            if i > 0 and "Water level" in header[i]:
+                positions.append(i - 1)  # Include location or pipe code info
+
+        # Rename water level columns to include pipe code
+        names = [header[i] for i in positions]
+        for i, col in enumerate(names[:-1]):
+            if "Water level in pipe from bottom up - in millimeter" in col:
+                names[i] = header[positions[i + 1]] + " Water level in pipe from bottom up - in millimeter"
+
+        # Keep only Date & Water level columns
+        final_cols_to_keep = []
+
+        for position, col in zip(positions, names):
+            if "Date" in col or "Water level in pipe from bottom up" in col:
+                final_cols_to_keep.append((position, col))
+
+        # Load just those columns; photo-URL and free-text columns are never parsed
+        df = read_water_level_columns(water_file_path, header, [position for position, _ in final_cols_to_keep])
+        df_final = df[[header[position] for position, _ in final_cols_to_keep]]
+        df_final.columns = [col for _, col in final_cols_to_keep]
+
+        # Rename water level columns using pipe codes
+        resolved, ambiguous = registry.resolver.resolve_columns(df_final.columns)
+        df_final.columns = resolved
+        if ambiguous:
+            details = "; ".join(f"{col} -> {', '.join(codes)}" for col, codes in list(ambiguous.items())[:5])
+            warnings.warn(f"{len(ambiguous)} column(s) match more than one pipe code, using the first: {details}",
+                          PipelineWarning, stacklevel=2)
+
+        return df_final
+    except Exception as e:
+        raise PipelineError(f"Error processing water level data: {str(e)}") from e
+
+# Combine duplicate columns, keeping the first non-null value per row
+def coalesce_duplicate_columns(df):
+    """Merge repeated columns (including pandas' "name.1" copies) in one pass"""
+    labels = list(df.columns)
+    existing = set(labels)
+
+    # Group column positions by base name; ".N" is only stripped when the
+    # base name is itself a column, so dotted names survive intact
+    groups = {}
+    for position, label in enumerate(labels):
+        base = label
+        if isinstance(label, str):
+            stem, dot, suffix = label.rpartition('.')
+            if dot and suffix.isdigit() and stem in existing:
+                base = stem
+        groups.setdefault(base, []).append(position)
+
+    columns = {}
+    for base, positions in groups.items():
+        if len(positions) == 1:
+            columns[base] = df.iloc[:, positions[0]]
+            continue
+
+        block = df.iloc[:, positions].to_numpy()
+        first_valid = (~pd.isna(block)).argmax(axis=1)
+        columns[base] = pd.Series(block[np.arange(len(block)), first_valid], index=df.index)
+
+    return pd.DataFrame(columns, index=df.index)
+
+def conflicting_readings(df):
+    """Per row, how many repeated date columns hold more than one distinct reading"""
+    labels = pd.Index(df.columns)
+    conflicts = np.zeros(len(df), dtype=np.int64)
+    for label in labels[labels.duplicated()].unique():
+        block = df.loc[:, labels == label]
+        if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in block.dtypes):
+            continue
+        values = block.to_numpy(dtype=np.float64, na_value=np.nan)
+        # fmax/fmin skip NaN, so one reading and a blank never conflict
+        highest = np.fmax.reduce(values, axis=1)
+        lowest = np.fmin.reduce(values, axis=1)
+        conflicts += ~np.isnan(highest) & (highest != lowest)
+    return conflicts
+
+# Farm workbook sheets read by process_data
+PVC_SHEET = 'PVC Pipes Kharif24'
+KHARIF_SHEET = 'Kharif 2024'
+
+def _find_column(columns, preferred, matches, error):
+    """preferred if present, else the first header matches() accepts"""
+    if preferred in columns:
+        return preferred
+    possible_matches = [col for col in columns if matches(str(col).lower())]
+    if possible_matches:
+        return possible_matches[0]
+    raise PipelineError(error)
+
+def resolve_farm_columns(pvc_columns, kharif_columns):
+    """Header names of the farm info columns, falling back to fuzzy matches"""
+    columns = {
+        'sowing': _find_column(
+            kharif_columns, "Kharif 24 Paddy sowing (DSR)",
+            lambda col: "sowing" in col or "dsr" in col,
+            "Could not find sowing date column in Kharif 2024 sheet"
+        ),
+        'farm_id_pvc': _find_column(
+            pvc_columns, "Farm ID Kharif 24",
+            lambda col: "farm" in col and "id" in col,
+            "Could not find farm ID column in PVC Pipes sheet"
+        ),
+        'farm_id_kharif': _find_column(
+            kharif_columns, "Kharif 24 FarmID",
+            lambda col: "farm" in col and "id" in col,
+            "Could not find farm ID column in Kharif 2024 sheet"
+        ),
+        'pipe_code': _find_column(
+            pvc_columns, "Pipe Code Kharif 24",
+            lambda col: "pipe" in col and "code" in col,
+            "Could not find pipe code column in PVC Pipes sheet"
+        ),
+    }
+    if 'Village' not in pvc_columns:
+        raise PipelineError("Could not find Village column in PVC Pipes sheet")
+    return columns
+
+def _needed_columns(columns):
+    pvc = list(dict.fromkeys([columns['farm_id_pvc'], 'Village', columns['pipe_code']]))
+    kharif = list(dict.fromkeys([columns['farm_id_kharif'], columns['sowing']]))
+    return {PVC_SHEET: pvc, KHARIF_SHEET: kharif}
+
+def _header_names(row):
+    """Column names as pandas would give them: blanks numbered, repeats suffixed"""
+    names = []
+    seen = {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _tidy_sheet(df):
+    # Blank cells read as NaN (not None) and trailing blank rows are dropped
+    df = df.dropna(how='all')
+    return df.where(df.notna(), np.nan).reset_index(drop=True)
+
+def _load_with_calamine(farm_file):
+    sheets = [PVC_SHEET, KHARIF_SHEET]
+    headers = pd.read_excel(rewind(farm_file), sheet_name=sheets, engine='calamine', nrows=0)
+    columns = resolve_farm_columns(list(headers[PVC_SHEET].columns), list(headers[KHARIF_SHEET].columns))
+    needed = _needed_columns(columns)
+
+    wanted = set(needed[PVC_SHEET]) | set(needed[KHARIF_SHEET])
+    frames = pd.read_excel(rewind(farm_file), sheet_name=sheets, engine='calamine',
+                           usecols=lambda col: col in wanted)
+    return {name: _tidy_sheet(frames[name][needed[name]]) for name in sheets}, columns
+
+def _load_with_openpyxl(farm_file):
+    import openpyxl
+
+    # Read-only mode streams rows instead of building every sheet's cell model
+    workbook = openpyxl.load_workbook(rewind(farm_file), read_only=True, data_only=True)
+    try:
+        headers = {}
+        for name in (PVC_SHEET, KHARIF_SHEET):
+            if name not in workbook.sheetnames:
+                raise PipelineError(f"Worksheet named '{name}' not found")
+            # Read-only sheets trust the file's <dimension> record, which some
+            # writers leave stale; without this rows past it are dropped silently
+            workbook[name].reset_dimensions()
+            first_row = next(workbook[name].iter_rows(max_row=1, values_only=True), ())
+            headers[name] = _header_names(first_row)
+
+        columns = resolve_farm_columns(headers[PVC_SHEET], headers[KHARIF_SHEET])
+        frames = {}
+        for name, wanted in _needed_columns(columns).items():
+            positions = [headers[name].index(col) for col in wanted]
+            rows = [
+                [row[p] if p < len(row) else None for p in positions]
+                for row in workbook[name].iter_rows(min_row=2, values_only=True)
+            ]
+            frames[name] = _tidy_sheet(pd.DataFrame(rows, columns=wanted))
+    finally:
+        workbook.close()
+    return frames, columns
+
+def load_farm_workbook(farm_file):
+    """The PVC Pipes and Kharif sheets, limited to the columns process_data uses.
+
+    Returns (pvc_pipes, kharif, columns) where columns maps each role
+    ('sowing', 'farm_id_pvc', 'farm_id_kharif', 'pipe_code') to the header
+    found for it. Uses the calamine engine when python-calamine is installed.
+    """
+    if importlib.util.find_spec("python_calamine") is not None:
+        frames, columns = _load_with_calamine(farm_file)
+    else:
+        frames, columns = _load_with_openpyxl(farm_file)
+    return frames[PVC_SHEET], frames[KHARIF_SHEET], columns
+
+# Incremental updates: work out what a new upload adds to an earlier result
+def find_water_increment(transposed, previous, info_columns):
+    """New pipes and new/changed dates in transposed compared to previous.
+
+    Returns None when the upload cannot be compared column by column
+    (repeated pipe codes), in which case the caller reprocesses everything.
+    """
+    current = coalesce_duplicate_columns(transposed)
+    if current['Pipe Code'].duplicated().any():
+        return None
+
+    current = current.set_index('Pipe Code')
+    known = previous.drop_duplicates(subset='Pipe Code').set_index('Pipe Code')
+    known_dates = [col for col in known.columns if col not in info_columns]
+
+    common_pipes = current.index.intersection(known.index)
+    common_dates = [col for col in current.columns if col in known_dates]
+    new_dates = [col for col in current.columns if col not in known_dates]
+
+    # A date changed if any known pipe now reads differently (NaN == NaN)
+    before = known.loc[common_pipes, common_dates]
+    after = current.loc[common_pipes, common_dates]
+    differs = ~(before.eq(after) | (before.isna() & after.isna()))
+    changed_dates = [col for col, changed in differs.any(axis=0).items() if changed]
+
+    return {
+        'values': current[new_dates + changed_dates],
+        'dates': new_dates + changed_dates,
+        'new_pipes': current.index.difference(known.index).tolist(),
+        'known_dates': known_dates,
+    }
+
+def apply_water_increment(previous, new_pipe_rows, increment):
+    """Patch new/changed dates into previous and append rows for new pipes"""
+    dates = increment['dates']
+    values = increment['values']
+
+    # Pipes missing from this upload keep what they had
+    present = previous['Pipe Code'].isin(values.index)
+    patch = values.reindex(previous['Pipe Code'])
+    patch.index = previous.index
+    patch = patch.where(present, previous.reindex(columns=dates), axis=0)
+
+    updated = previous.drop(columns=[col for col in dates if col in previous.columns])
+    updated = pd.concat([updated, patch], axis=1)
+
+    # Keep dates together: new ones go right after the last known date
+    columns = list(previous.columns)
+    last_date = max(columns.index(col) for col in increment['known_dates']) if increment['known_dates'] else 0
+    new_dates = [col for col in dates if col not in columns]
+    columns = columns[:last_date + 1] + new_dates + columns[last_date + 1:]
+
+    return pd.concat([updated[columns], new_pipe_rows], ignore_index=True)
+
+# Sowing dates are tried in this order; the first format that reads a value wins
+SOWING_DATE_FORMATS = ['%d/%m/%Y', '%Y-%m-%d', '%m/%d/%Y', '%d-%m-%Y']
+DEFAULT_SOWING_DATE = pd.Timestamp(2024, 6, 16)
+
+
+def parse_sowing_dates(values, formats=SOWING_DATE_FORMATS):
+    """Parse a column of dates written in mixed formats, NaT where none fits.
+
+    Each distinct value is parsed once. Excel date cells are taken as they
+    are; text is tried against each format in turn over all still-unparsed
+    values at once, then against pandas' own day-first inference.
+    """
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[us]')
+    is_date = uniques.map(lambda v: isinstance(v, (datetime.date, np.datetime64))).astype(bool)
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(uniques[is_date], errors='coerce')
+
+    text = uniques[uniques.map(lambda v: isinstance(v, str)).astype(bool)].str.strip()
+    for fmt in formats:
+        pending = text[parsed[text.index].isna()]
+        if pending.empty:
+            break
+        parsed[pending.index] = pd.to_datetime(pending, format=fmt, errors='coerce')
+
+    pending = text[parsed[text.index].isna()]
+    if not pending.empty:
+        parsed[pending.index] = pd.to_datetime(pending, format='mixed', dayfirst=True, errors='coerce')
+
+    # Missing values have code -1, which reindexes to NaT
+    result = parsed.reindex(codes)
+    result.index = values.index
+    return result
+
+# Main processing function
+def process_data(farm_file, water_file, previous=None):
+    """Merge farm info and water levels into one row per pipe, one column per date"""
+    # Load just the farm info columns we need from the two Excel sheets
+    with profiling.stage("Excel parsing") as span:
+        pvc_pipes_kharif, kharif_2024, columns = load_farm_workbook(farm_file)
+        span.set_frame(pvc_pipes_kharif)
+    sowing_column = columns['sowing']
+    farm_id_col_pvc = columns['farm_id_pvc']
+    farm_id_col_kharif = columns['farm_id_kharif']
+    pipe_code_col = columns['pipe_code']
+
+    # Known pipes: the sidecar registry plus every pipe listed in the workbook
+    with profiling.stage("Pipe registry"):
+        registry = load_registry().extend(pvc_pipes_kharif[pipe_code_col].tolist())
+
+    # Process water level data
+    with profiling.stage("CSV parsing") as span:
+        water_df = process_water_level_data(water_file, registry)
+        span.set_frame(water_df)
+
+    with profiling.stage("Transpose") as span:
+        # Extract Date column
+        date_col = [col for col in water_df.columns if "Date" in col][0]
+
+        # Set date column as index for transposition
+        water_df.set_index(date_col, inplace=True)
+
+        # Transpose water_df: rows become pipes, columns become dates
+        transposed = water_df.transpose()
+        transposed.reset_index(inplace=True)
+        transposed.rename(columns={'index': 'Pipe Code'}, inplace=True)
+        transposed['Pipe Code'] = registry.normalize(transposed['Pipe Code'])
+        span.set_frame(transposed)
+
+    # Incremental mode: known pipes only get their new or changed dates
+    # patched in; just the new pipes go through the merges below
+    increment = None
+    if previous is not None:
+        with profiling.stage("Find new data"):
+            info_columns = ['Farm ID', 'Location', 'Date of Sowing', pipe_code_col]
+            increment = find_water_increment(transposed, previous, info_columns)
+        if increment is not None:
+            if not increment['dates'] and not increment['new_pipes']:
+                return previous
+            transposed = transposed[transposed['Pipe Code'].isin(increment['new_pipes'])]
+
+    # Ensure consistent column naming for merging
+    pvc_pipes_kharif = pvc_pipes_kharif.rename(columns={farm_id_col_pvc: 'Kharif 24 FarmID'})
+    kharif_2024 = kharif_2024.rename(columns={farm_id_col_kharif: 'Kharif 24 FarmID'})
+
+    # Merge farm info and sowing data
+    with profiling.stage("Merge farm sheets") as span:
+        kharif_subset = kharif_2024[['Kharif 24 FarmID', sowing_column]].copy()
+
+        # Merge with pipe data
+        merged_data = pd.merge(
+            pvc_pipes_kharif,
+            kharif_subset,
+            on='Kharif 24 FarmID',
+            how='left'
+        )
+
+        # Standardize pipe codes for merging, on the registry's keys
+        merged_data[pipe_code_col] = registry.normalize(merged_data[pipe_code_col])
+        span.set_frame(merged_data)
+
+    # Merge on Pipe Code
+    with profiling.stage("Merge pipes") as span:
+        final_df = pd.merge(
+            transposed,
+            merged_data[['Kharif 24 FarmID', 'Village', sowing_column, pipe_code_col]],
+            left_on='Pipe Code',
+            right_on=pipe_code_col,
+            how='inner'
+        )
+        span.set_frame(final_df)
+
+    # Rename columns for clarity
+    final_df.rename(columns={
+        'Kharif 24 FarmID': 'Farm ID',
+        'Village': 'Location',
+        sowing_column: 'Date of Sowing',
+    }, inplace=True)
+
+    # Convert sowing dates, filling unreadable or missing ones with the default
+    with profiling.stage("Sowing dates", final_df):
+        sowing_dates = parse_sowing_dates(final_df['Date of Sowing'])
+        defaulted = int(sowing_dates.isna().sum())
+        if defaulted:
+            warnings.warn(
+                f"{defaulted} pipe row(s) had no readable sowing date; "
+                f"using {DEFAULT_SOWING_DATE:%d/%m/%Y}",
+                PipelineWarning
+            )
+        final_df['Date of Sowing'] = sowing_dates.fillna(DEFAULT_SOWING_DATE)
+
+    # Several survey rows on one day for the same pipe: only the first
+    # reading is kept below, so say so when they disagree
+    with profiling.stage("Same-day readings", final_df):
+        conflicts = conflicting_readings(final_df)
+        if conflicts.any():
+            pipes = final_df.loc[conflicts > 0, 'Pipe Code'].astype(str).tolist()
+            warnings.warn(
+                f"{int(conflicts.sum())} pipe-day(s) on {len(pipes)} pipe(s) had differing same-day "
+                f"readings; kept the first: {', '.join(pipes[:5])}{' ...' if len(pipes) > 5 else ''}",
+                PipelineWarning
+            )
+
+    # Normalize columns (handle duplicate column names)
+    with profiling.stage("Coalesce columns") as span:
+        merged_df = coalesce_duplicate_columns(final_df)
+        span.set_frame(merged_df)
+
+    if increment is not None:
+        with profiling.stage("Apply new data") as span:
+            merged_df = apply_water_increment(previous, merged_df, increment)
+            span.set_frame(merged_df)
+    return merged_df
+
+# Identifier columns of a processed frame; the others are dated readings
+INFO_COLUMNS = ['Pipe Code', 'Farm ID', 'Location', 'Date of Sowing']
+
+def date_columns(columns):
+    """Headers that read as dates, with their parsed dates, in column order"""
+    labels = pd.Index(columns)
+    parsed = pd.to_datetime(pd.Index(labels.astype(str)), format='mixed', errors='coerce')
+    is_date = ~parsed.isna() & ~labels.isin(INFO_COLUMNS)
+    return labels[is_date].tolist(), parsed[is_date]
+
+def text_identifiers(df):
+    """df with its identifier columns as strings.
+
+    Workbooks mix numeric and text IDs (101 next to "K24-00001"), which a
+    Parquet column cannot hold; missing IDs stay missing.
+    """
+    return df.astype({col: str for col in ('Pipe Code', 'Farm ID', 'Location') if col in df.columns})
+
+# Long-format table used by the charts, built once per processed dataset
+def build_water_levels(df, flagged=None):
+    """Melt the wide pipe x date frame into one row per measurement.
+
+    flagged, a boolean frame with df's index and date columns, adds a
+    "Flagged" column marking readings that failed the quality checks.
+    """
+    date_labels, dates = date_columns(df.columns)
+    id_columns = ['Farm ID', 'Pipe Code', 'Date of Sowing']
+    columns = ['Farm ID', 'Pipe Code', 'Date', 'Days from Sowing', 'Water Level', 'Date of Sowing']
+    if flagged is not None:
+        columns.append('Flagged')
+
+    # Nothing dated to melt: an empty table the charts can still filter
+    if not date_labels:
+        empty = pd.DataFrame({
+            'Farm ID': df['Farm ID'].iloc[:0],
+            'Pipe Code': df['Pipe Code'].iloc[:0],
+            'Date': pd.Series(dtype='datetime64[us]'),
+            'Days from Sowing': pd.Series(dtype='int64'),
+            'Water Level': pd.Series(dtype='float32'),
+            'Date of Sowing': pd.to_datetime(df['Date of Sowing'].iloc[:0]),
+            'Flagged': pd.Series(dtype=bool),
+        })
+        return empty[columns]
+
+    # Later rows win when a farm lists the same pipe twice
+    wide = df.drop_duplicates(subset=['Farm ID', 'Pipe Code'], keep='last')
+
+    water_levels = wide.melt(
+        id_vars=id_columns,
+        value_vars=date_labels,
+        var_name='Date',
+        value_name='Water Level',
+        ignore_index=False
+    )
+    water_levels['Water Level'] = pd.to_numeric(water_levels['Water Level'], errors='coerce')
+    water_levels = water_levels.dropna(subset=['Water Level'])
+
+    if flagged is not None:
+        rows = flagged.index.get_indexer(water_levels.index)
+        cols = pd.Index(flagged.columns).get_indexer(water_levels['Date'])
+        water_levels['Flagged'] = flagged.to_numpy(dtype=bool)[rows, cols]
+
+    # Parse each distinct date header once instead of once per cell
+    water_levels['Date'] = water_levels['Date'].map(pd.Series(dates, index=date_labels))
+
+    sowing_dates = pd.to_datetime(water_levels['Date of Sowing'])
+    water_levels['Days from Sowing'] = (water_levels['Date'] - sowing_dates).dt.days
+
+    # Keep pipes in sheet order with their dates ascending, as the charts expect
+    water_levels = water_levels.sort_index(kind='stable').reset_index(drop=True)
+    return water_levels[columns]
+
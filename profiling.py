@@ -0,0 +1,149 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages only record anything inside trace(); elsewhere stage() is a no-op
+_active = contextvars.ContextVar("digiv_trace", default=None)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss():
+    """Resident memory of this process in bytes, or None where unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Span:
+    """One timed stage: wall time, frame shape and resident memory change"""
+
+    def __init__(self, name, depth, started):
+        self.name = name
+        self.depth = depth
+        self.started = started
+        self.seconds = None
+        self.rows = None
+        self.columns = None
+        self.memory_delta = None
+
+    def set_frame(self, df):
+        """Record the shape of the frame the stage produced"""
+        self.rows, self.columns = df.shape
+
+
+class _NullSpan:
+    def set_frame(self, df):
+        pass
+
+
+class _Disabled:
+    # Shared by every stage() call made outside a trace
+    def __enter__(self):
+        return _NULL_SPAN
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_DISABLED = _Disabled()
+
+
+class Trace:
+    """Stages recorded during one traced run, in the order they started"""
+
+    def __init__(self, name, on_stage=None):
+        self.name = name
+        # Called with each new Span; may raise to abort the traced run
+        self.on_stage = on_stage
+        self.created = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, frame=None):
+        with self._lock:
+            span = Span(name, self._depth, time.perf_counter() - self.origin)
+            self.spans.append(span)
+            self._depth += 1
+        if frame is not None:
+            span.set_frame(frame)
+
+        memory_before = _rss()
+        try:
+            if self.on_stage is not None:
+                self.on_stage(span)
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - self.origin - span.started
+            memory_after = _rss()
+            if memory_before is not None and memory_after is not None:
+                span.memory_delta = memory_after - memory_before
+            with self._lock:
+                self._depth -= 1
+
+    @property
+    def seconds(self):
+        return max((s.started + (s.seconds or 0) for s in self.spans), default=0.0)
+
+    def records(self):
+        """One dict per stage, ready for a DataFrame or a JSON log"""
+        return [{
+            "stage": span.name,
+            "depth": span.depth,
+            "start_s": round(span.started, 6),
+            "seconds": None if span.seconds is None else round(span.seconds, 6),
+            "rows": span.rows,
+            "columns": span.columns,
+            "memory_delta_bytes": span.memory_delta,
+        } for span in self.spans]
+
+    def to_json(self):
+        """Structured log of the run"""
+        return json.dumps({
+            "trace": self.name,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.created)),
+            "seconds": round(self.seconds, 6),
+            "stages": self.records(),
+        }, indent=2)
+
+    def to_chrome_trace(self):
+        """Trace Event Format JSON, viewable in Perfetto or chrome://tracing"""
+        events = [{
+            "name": span.name,
+            "cat": self.name,
+            "ph": "X",
+            "ts": round(span.started * 1e6),
+            "dur": round((span.seconds or 0) * 1e6),
+            "pid": os.getpid(),
+            "tid": 0,
+            "args": {"rows": span.rows, "columns": span.columns, "memory_delta_bytes": span.memory_delta},
+        } for span in self.spans]
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
+
+
+@contextmanager
+def trace(name, on_stage=None):
+    """Record every stage() entered in this context into a new Trace"""
+    current = Trace(name, on_stage)
+    token = _active.set(current)
+    try:
+        yield current
+    finally:
+        _active.reset(token)
+
+
+def stage(name, frame=None):
+    """Time a block as one stage of the active trace; free when not tracing"""
+    current = _active.get()
+    if current is None:
+        return _DISABLED
+    return current.stage(name, frame)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from pipeline import date_columns
+
+# Readings are millimetres from the bottom of the pipe, so nothing outside
+# 0..PIPE_LENGTH_MM can be a real water level
+PIPE_LENGTH_MM = 300
+
+# Hampel-style check: distance from the centred rolling median of a pipe's
+# readings, over ROLLING_DATES survey dates, in robust standard deviations
+ROLLING_DATES = 7
+OUTLIER_Z = 3.5
+# Jumps smaller than this are never outliers, however steady the pipe
+MIN_OUTLIER_MM = 25
+
+# This many identical readings in a row looks like a stuck or copied value
+FLATLINE_READINGS = 5
+
+CHECKS = ('Out of Range', 'Outlier', 'Flatline')
+
+
+def check_readings(values, max_level=PIPE_LENGTH_MM, window=ROLLING_DATES, z=OUTLIER_Z,
+                   min_jump=MIN_OUTLIER_MM, flatline=FLATLINE_READINGS):
+    """Boolean pipe x date masks of suspect readings, one per check.
+
+    values holds one row per pipe and one column per date, dates ascending.
+    Every check runs over the whole matrix at once.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    observed = ~np.isnan(values)
+    out_of_range = observed & ((values < 0) | (values > max_level))
+    valid = np.where(out_of_range, np.nan, values)
+
+    # Rolling median per pipe; pandas rolls every column in one pass
+    median = pd.DataFrame(valid.T).rolling(window, center=True, min_periods=3).median().to_numpy().T
+    residual = np.abs(valid - median)
+    scored = ~np.isnan(residual).all(axis=1)
+    scale = np.full(len(values), np.nan)
+    scale[scored] = 1.4826 * np.nanmedian(residual[scored], axis=1)
+    threshold = np.fmax(z * scale, min_jump)[:, None]
+    with np.errstate(invalid='ignore'):
+        outlier = residual > threshold
+
+    # Runs of equal consecutive readings per pipe, skipping unobserved dates.
+    # Zero is left alone: a dried-out pipe really does read 0 for days.
+    rows, cols = np.nonzero(~np.isnan(valid))
+    readings = valid[rows, cols]
+    starts = np.ones(len(readings), dtype=bool)
+    starts[1:] = (rows[1:] != rows[:-1]) | (readings[1:] != readings[:-1])
+    run = np.cumsum(starts) - 1
+    run_length = np.bincount(run)[run] if len(run) else run
+    flat = np.zeros(values.shape, dtype=bool)
+    flat[rows, cols] = (run_length >= flatline) & (readings != 0)
+
+    return {'Out of Range': out_of_range, 'Outlier': outlier, 'Flatline': flat}
+
+
+def flagged(checks):
+    """Readings failing any check"""
+    return np.logical_or.reduce(list(checks.values()))
+
+
+def pipe_report(checks, observed, farm_ids, pipe_codes):
+    """One row per pipe: readings, failures per check and the share flagged"""
+    any_flag = flagged(checks)
+    report = pd.DataFrame({
+        'Farm ID': farm_ids,
+        'Pipe Code': pipe_codes,
+        'Readings': observed.sum(axis=1),
+    })
+    for name, mask in checks.items():
+        report[name] = mask.sum(axis=1)
+    report['Flagged'] = any_flag.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        report['Flagged Share'] = report['Flagged'] / report['Readings']
+    return report
+
+
+def run_checks(values, dates, farm_ids, pipe_codes):
+    """Per-pipe report and pipe x date flags for readings in any date order"""
+    # The checks expect dates ascending; flags go back to column order
+    order = np.argsort(dates, kind='stable')
+    ordered = values[:, order]
+    checks = check_readings(ordered)
+
+    report = pipe_report(checks, ~np.isnan(ordered), farm_ids, pipe_codes)
+    # Same rule as the chart table: the last row of a repeated pipe wins
+    report = report.drop_duplicates(subset=['Farm ID', 'Pipe Code'], keep='last').reset_index(drop=True)
+
+    flags = np.zeros(values.shape, dtype=bool)
+    flags[:, order] = flagged(checks)
+    return report, flags
+
+
+def quality_report(df):
+    """Per-pipe check results for a processed frame from process_data"""
+    labels, dates = date_columns(df.columns)
+    values = df[labels].to_numpy(dtype=np.float64, na_value=np.nan)
+    report, _ = run_checks(values, dates, df['Farm ID'].reset_index(drop=True),
+                           df['Pipe Code'].reset_index(drop=True))
+    return report
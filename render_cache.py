@@ -0,0 +1,61 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# Rendered chart images shared by every session in this process
+MAX_BYTES = int(os.environ.get("DIGIV_RENDER_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# st.image decodes, resizes and re-encodes anything wider on every display
+MAX_IMAGE_WIDTH = 1460
+
+_images = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+
+
+def render_png(fig, dpi=150):
+    """PNG bytes of a Matplotlib figure, no wider than MAX_IMAGE_WIDTH pixels"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    png = buffer.getvalue()
+
+    # The IHDR chunk holds the pixel width at bytes 16-20
+    width = int.from_bytes(png[16:20], 'big')
+    if width > MAX_IMAGE_WIDTH:
+        return render_png(fig, int(dpi * MAX_IMAGE_WIDTH / width))
+    return png
+
+
+def get(key):
+    """Return the cached image bytes for key, or None"""
+    with _lock:
+        image = _images.get(key)
+        if image is not None:
+            _images.move_to_end(key)
+        return image
+
+
+def put(key, image):
+    """Cache image bytes, evicting least recently used entries over budget"""
+    global _total_bytes
+    if len(image) > MAX_BYTES:
+        return
+
+    with _lock:
+        previous = _images.pop(key, None)
+        if previous is not None:
+            _total_bytes -= len(previous)
+        _images[key] = image
+        _total_bytes += len(image)
+
+        while _total_bytes > MAX_BYTES:
+            _, evicted = _images.popitem(last=False)
+            _total_bytes -= len(evicted)
+
+
+def clear():
+    global _total_bytes
+    with _lock:
+        _images.clear()
+        _total_bytes = 0
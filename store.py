@@ -0,0 +1,208 @@
+import glob
+import hashlib
+import os
+import threading
+
+import pandas as pd
+
+from pipeline import build_water_levels
+
+# Processed results as one row per measurement, hive-partitioned by
+# season and village; override the location with DIGIV_STORE_DIR
+STORE_DIR = os.environ.get(
+    "DIGIV_STORE_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "digiv", "store")
+)
+
+# Rows are sorted by farm and date within each file, so small row groups let
+# farm and date-range filters skip most of a file from its statistics alone
+ROW_GROUP_ROWS = 16_384
+
+# Download files built from the shared datasets, most recent kept
+EXPORT_DIR = "_exports"
+MAX_EXPORTS = int(os.environ.get("DIGIV_MAX_EXPORTS", 8))
+EXPORT_CHUNK_ROWS = 5_000
+
+_export_lock = threading.Lock()
+
+
+def store_name(key):
+    """Short file-safe name for a dataset key"""
+    return hashlib.sha256(str(key).encode()).hexdigest()[:16]
+
+
+def season_of(dates):
+    """Season of a set of measurement dates: kharif-YYYY or rabi-YYYY"""
+    first = pd.Timestamp(pd.Series(dates).min())
+    if 4 <= first.month <= 9:
+        return f"kharif-{first.year}"
+    # Rabi runs across the new year; label it by the year it starts
+    return f"rabi-{first.year if first.month >= 10 else first.year - 1}"
+
+
+def _files(name, root):
+    return sorted(glob.glob(os.path.join(root, "season=*", "village=*", f"{name}-*.parquet")))
+
+
+def has_dataset(name, root=STORE_DIR):
+    return bool(_files(name, root))
+
+
+def list_datasets(root=STORE_DIR):
+    """Names of the datasets in the store"""
+    files = glob.glob(os.path.join(root, "season=*", "village=*", "*.parquet"))
+    return sorted({os.path.basename(path).rsplit("-", 1)[0] for path in files})
+
+
+def write_dataset(df, name, root=STORE_DIR, season=None):
+    """Persist a processed wide frame, replacing any earlier copy of name"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    long = build_water_levels(df)
+    if long.empty:
+        return None
+
+    # Location travels as the village partition rather than a column
+    locations = df.drop_duplicates(subset=['Farm ID', 'Pipe Code'], keep='last')[['Farm ID', 'Pipe Code', 'Location']]
+    long = long.merge(locations, on=['Farm ID', 'Pipe Code'], how='left')
+    season = season or season_of(long['Date'])
+
+    frame = long.assign(season=season).rename(columns={'Location': 'village'})
+    frame = frame.astype({'Farm ID': str, 'Pipe Code': str, 'village': str})
+    frame = frame.sort_values(['village', 'Farm ID', 'Pipe Code', 'Date'], kind='stable')
+
+    for path in _files(name, root):
+        os.remove(path)
+
+    partitioning = ds.partitioning(pa.schema([("season", pa.string()), ("village", pa.string())]), flavor="hive")
+    ds.write_dataset(
+        pa.Table.from_pandas(frame, preserve_index=False),
+        root,
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"{name}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=ROW_GROUP_ROWS,
+    )
+    _prune_season(name, season, frame, root)
+    return season
+
+
+def _prune_season(name, season, frame, root=STORE_DIR):
+    """Remove the season's earlier datasets whose farms all appear in name's frame.
+
+    Every upload, append runs included, is a full copy of its villages, so
+    a re-upload makes the earlier copy redundant; other villages' uploads
+    are kept.
+    """
+    import pyarrow.dataset as ds
+
+    directory = os.path.join(root, f"season={season}")
+    own_villages = {os.path.dirname(path) for path in glob.glob(os.path.join(directory, "village=*", f"{name}-*.parquet"))}
+    farms = set(frame['Farm ID'])
+
+    files = {}
+    for path in glob.glob(os.path.join(directory, "village=*", "*.parquet")):
+        other = os.path.basename(path).rsplit("-", 1)[0]
+        if other != name:
+            files.setdefault(other, []).append(path)
+
+    for other, paths in files.items():
+        # Village directories rule most datasets out without reading them
+        if not {os.path.dirname(path) for path in paths} <= own_villages:
+            continue
+        try:
+            table = ds.dataset(paths, format="parquet").to_table(columns=['Farm ID'])
+        except OSError:
+            continue
+        if set(table.column('Farm ID').unique().to_pylist()) <= farms:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def load(name, farms=None, start=None, end=None, villages=None, season=None, columns=None, root=STORE_DIR):
+    """Measurements of a stored dataset matching the given filters.
+
+    Season and village prune whole directories; farm and date filters are
+    checked against row group statistics, so only matching groups are read,
+    and only the requested columns are decoded.
+    """
+    import pyarrow.dataset as ds
+
+    files = _files(name, root)
+    if not files:
+        raise FileNotFoundError(f"No stored dataset named {name}")
+    dataset = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=root)
+
+    conditions = []
+    if farms:
+        conditions.append(ds.field('Farm ID').isin([str(farm) for farm in farms]))
+    if villages:
+        conditions.append(ds.field('village').isin([str(village) for village in villages]))
+    if season:
+        conditions.append(ds.field('season') == season)
+    if start is not None:
+        conditions.append(ds.field('Date') >= pd.Timestamp(start).to_pydatetime())
+    if end is not None:
+        conditions.append(ds.field('Date') <= pd.Timestamp(end).to_pydatetime())
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    if columns is not None:
+        columns = ['village' if col == 'Location' else col for col in columns]
+    table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas().rename(columns={'village': 'Location'})
+
+
+def _write_export(dataset, path, fmt):
+    """Write dataset.to_frame() chunk by chunk to path"""
+    if fmt == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for i, chunk in enumerate(dataset.iter_frames(EXPORT_CHUNK_ROWS)):
+                chunk.to_csv(f, header=i == 0, index=False)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in dataset.iter_frames(EXPORT_CHUNK_ROWS):
+            # Plain strings keep every chunk on the first chunk's schema
+            categories = chunk.select_dtypes('category').columns
+            chunk = chunk.astype({col: str for col in categories})
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema_arrow, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def export_file(dataset, key, fmt, root=STORE_DIR):
+    """Path of a CSV or Parquet export of a shared dataset, built on first use"""
+    directory = os.path.join(root, EXPORT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{store_name(key)}.{fmt}")
+
+    with _export_lock:
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        tmp_path = f"{path}.tmp"
+        _write_export(dataset, tmp_path, fmt)
+        os.replace(tmp_path, path)
+
+        exports = sorted(glob.glob(os.path.join(directory, "*.*")), key=os.path.getmtime)
+        for old in exports[:-MAX_EXPORTS]:
+            os.remove(old)
+    return path
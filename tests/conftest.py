@@ -0,0 +1,43 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The app's modules live at the repository root, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+from pipeline import PipelineWarning  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    """Generated uploads trigger the pipeline's data warnings; tests check them with pytest.warns"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", PipelineWarning)
+        yield
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """Small generated farm workbook and water level CSV, as process_data reads them"""
+    rng = np.random.default_rng(0)
+    farm_path = tmp_path / "farm.xlsx"
+    water_path = tmp_path / "water.csv"
+    codes = benchmark.generate_farm_workbook(farm_path, 6, 2, rng)
+    benchmark.generate_water_csv(water_path, codes, 10, rng)
+    return farm_path, water_path
+
+
+@pytest.fixture
+def mixed_id_uploads(uploads):
+    """The uploads with one Farm ID entered as the number 101, as Excel keeps it"""
+    farm_path, water_path = uploads
+    sheets = pd.read_excel(farm_path, sheet_name=None)
+    with pd.ExcelWriter(farm_path) as writer:
+        for name, sheet in sheets.items():
+            sheet.replace("K24-00000", 101).to_excel(writer, sheet_name=name, index=False)
+    return farm_path, water_path
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from aggregates import AggregateIndex
+
+
+def water_levels(seed=0, rows=400):
+    rng = np.random.default_rng(seed)
+    farms = rng.choice(['F1', 'F2', 'F3'], rows)
+    days = rng.integers(0, 40, rows).astype(float)
+    days[rng.random(rows) < 0.1] = np.nan  # no usable sowing date
+    return pd.DataFrame({
+        'Farm ID': farms,
+        'Pipe Code': [f"{farm}_{pipe}" for farm, pipe in zip(farms, rng.integers(1, 4, rows))],
+        'Days from Sowing': days,
+        'Water Level': rng.uniform(0, 250, rows),
+    })
+
+
+def test_series_matches_groupby():
+    df = water_levels()
+    index = AggregateIndex(df)
+    farm = df[df['Farm ID'] == 'F2'].dropna(subset=['Days from Sowing'])
+
+    daily = index.series('daily', index.pipe_indices('F2'))
+    expected = farm.groupby('Days from Sowing')['Water Level'].agg(['mean', 'count', 'std'])
+    assert daily['Bucket'].tolist() == expected.index.astype(int).tolist()
+    np.testing.assert_allclose(daily[['mean', 'count', 'std']].to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+    weekly = index.series('weekly', index.pipe_indices('F2', ['F2_1', 'F2_3']))
+    subset = farm[farm['Pipe Code'].isin(['F2_1', 'F2_3'])]
+    expected = subset.groupby(subset['Days from Sowing'] // 7 + 1)['Water Level'].agg(['mean', 'count', 'std'])
+    assert weekly['Bucket'].tolist() == expected.index.astype(int).tolist()
+    np.testing.assert_allclose(weekly[['mean', 'count', 'std']].to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+
+def test_summary_and_leaderboard_include_undated_readings():
+    df = water_levels(1)
+    index = AggregateIndex(df)
+    farm = df[df['Farm ID'] == 'F1']
+
+    summary = index.summary(index.pipe_indices('F1'))
+    assert summary['pipes'] == farm['Pipe Code'].nunique()
+    assert summary['count'] == len(farm)
+    np.testing.assert_allclose([summary['mean'], summary['std']],
+                               [farm['Water Level'].mean(), farm['Water Level'].std()], rtol=1e-9)
+
+    board = index.leaderboard()
+    expected = df.groupby('Farm ID')['Water Level'].agg(['mean', 'count']).sort_values('mean', ascending=False)
+    assert board['Farm ID'].tolist() == expected.index.tolist()
+    assert board['Measurements'].tolist() == expected['count'].tolist()
+    np.testing.assert_allclose(board['Average (mm)'], expected['mean'], rtol=1e-9)
+
+
+def test_unknown_farm_has_no_pipes():
+    index = AggregateIndex(water_levels())
+    indices = index.pipe_indices('nope')
+    assert len(indices) == 0
+    assert index.series('daily', indices).empty
+    assert index.summary(indices)['count'] == 0
@@ -0,0 +1,19 @@
+import pandas as pd
+
+import batch
+
+
+def test_mixed_type_farm_ids_are_written(tmp_path, mixed_id_uploads):
+    farm, water = mixed_id_uploads
+    result = batch.run_job("village", str(farm), str(water), str(tmp_path))
+    assert result["status"] == "ok", result.get("error")
+
+    written = batch.load_store_dataset(str(tmp_path), "village")
+    assert len(written) == result["rows"]
+    assert "101" in set(written['Farm ID'])
+    assert pd.api.types.is_string_dtype(written['Farm ID'])
+
+    # The per-pipe quality report is written next to it
+    report = pd.read_parquet(tmp_path / result["quality_path"])
+    assert report['Flagged'].sum() == result["flagged_readings"]
+    assert "101" in set(report['Farm ID'])
@@ -0,0 +1,16 @@
+import json
+import warnings
+
+import benchmark
+
+
+def test_small_run_writes_a_json_report(tmp_path):
+    output = tmp_path / "report.json"
+    with warnings.catch_warnings():
+        # main() silences warnings for the whole process
+        assert benchmark.main(["--size", "small", "--no-charts", "--repeat", "1", "--output", str(output)]) == 0
+
+    report = json.loads(output.read_text())
+    [result] = report["results"]
+    assert (result["size"], result["farms"], result["dates"]) == ("small", *benchmark.SIZES["small"][::2])
+    assert set(result["stages"]) >= {"process_data", "check_readings", "compact_dataset"}
@@ -0,0 +1,29 @@
+import pandas as pd
+
+import cli
+
+
+def test_mixed_type_farm_ids_write_to_parquet(tmp_path, mixed_id_uploads, capsys):
+    farm, water = mixed_id_uploads
+    output = tmp_path / "result.parquet"
+    assert cli.main([str(farm), str(water), str(output)]) == 0
+
+    written = pd.read_parquet(output)
+    assert "101" in set(written['Farm ID'])
+    assert not (tmp_path / "result.parquet.tmp").exists()
+
+
+def test_write_errors_are_reported(tmp_path, uploads, capsys):
+    farm, water = uploads
+    assert cli.main([str(farm), str(water), str(tmp_path / "missing" / "result.csv")]) == 1
+    assert capsys.readouterr().err.startswith("error: ")
+
+
+def test_quality_report_is_written(tmp_path, uploads, capsys):
+    farm, water = uploads
+    report_path = tmp_path / "quality.csv"
+    assert cli.main([str(farm), str(water), str(tmp_path / "result.csv"), "--quality", str(report_path)]) == 0
+
+    report = pd.read_csv(report_path)
+    assert {'Pipe Code', 'Out of Range', 'Outlier', 'Flatline', 'Flagged'} <= set(report.columns)
+    assert "quality: " in capsys.readouterr().err
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from pipeline import coalesce_duplicate_columns
+
+
+def bfill_coalesce(df):
+    # The column-at-a-time version coalesce_duplicate_columns replaced
+    groups = {}
+    for col in df.columns:
+        groups.setdefault(col.split('.')[0], []).append(col)
+    return pd.DataFrame({base: df[cols].bfill(axis=1).iloc[:, 0] for base, cols in groups.items()})
+
+
+def test_matches_the_bfill_version():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 250, (30, 6)).round(1)
+    values[rng.random(values.shape) < 0.5] = np.nan
+    df = pd.DataFrame(values, columns=['2024-06-15', 'farmer_01', '2024-06-15.1', '2024-06-16', 'farmer_01.1', '2024-06-15.2'])
+    df['Farm ID'] = [f"F{i % 4}" for i in range(30)]
+
+    result = coalesce_duplicate_columns(df)
+    pd.testing.assert_frame_equal(result, bfill_coalesce(df), check_dtype=False)
+    assert list(result.columns) == ['2024-06-15', 'farmer_01', '2024-06-16', 'Farm ID']
+
+
+def test_repeated_labels_keep_the_first_value_per_row():
+    df = pd.DataFrame([[np.nan, 2.0, 3.0], [1.0, np.nan, 5.0], [np.nan, np.nan, np.nan]], columns=['d', 'd', 'd'])
+    result = coalesce_duplicate_columns(df)
+    assert list(result.columns) == ['d']
+    assert result['d'].tolist()[:2] == [2.0, 1.0] and np.isnan(result['d'].iloc[2])
+
+
+def test_dotted_names_survive():
+    df = pd.DataFrame({'v1.5': [1.0], 'Date': ['2024-06-15'], 'Date.1': [None]})
+    result = coalesce_duplicate_columns(df)
+    assert list(result.columns) == ['v1.5', 'Date']
+    assert result.iloc[0].tolist() == [1.0, '2024-06-15']
@@ -0,0 +1,26 @@
+import re
+import zipfile
+
+import numpy as np
+
+import benchmark
+from pipeline import PVC_SHEET, _load_with_openpyxl
+
+
+def stale_dimensions(path, out):
+    """Copy of the workbook whose sheets all claim to end at C5"""
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(out, "w") as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename.startswith("xl/worksheets/"):
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1:C5"/>', data)
+            target.writestr(item, data)
+    return out
+
+
+def test_openpyxl_reads_past_stale_dimension(tmp_path):
+    farm = tmp_path / "farm.xlsx"
+    codes = benchmark.generate_farm_workbook(farm, 15, 2, np.random.default_rng(0))
+
+    frames, columns = _load_with_openpyxl(stale_dimensions(farm, tmp_path / "stale.xlsx"))
+    assert len(frames[PVC_SHEET]) == len(codes)
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+from fleet import FleetMatrix
+
+
+def water_levels(farms, days, levels):
+    return pd.DataFrame({'Farm ID': farms, 'Days from Sowing': days, 'Water Level': levels})
+
+
+def test_daily_mean_per_farm():
+    fleet = FleetMatrix(water_levels(['A', 'A', 'A', 'B'], [0, 0, 2, 1], [10.0, 20.0, 30.0, 40.0]))
+    assert list(fleet.farm_ids) == ['A', 'B']
+    assert list(fleet.days) == [0, 1, 2]
+    np.testing.assert_array_equal(fleet.farm_row('A'), [15.0, np.nan, 30.0])
+    np.testing.assert_array_equal(fleet.farm_row('B'), [np.nan, 40.0, np.nan])
+
+
+def test_readings_without_farm_id_are_skipped():
+    fleet = FleetMatrix(water_levels(['A', None, 'B'], [0, 1, 2], [10.0, 99.0, 30.0]))
+    assert list(fleet.farm_ids) == ['A', 'B']
+    assert not np.isin(99.0, fleet.values)
+    assert fleet.farm_row(None) is None
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+import benchmark
+import history
+from datasets import CompactDataset
+from pipeline import process_data
+
+
+def season_dataset(tmp_path, start, seed=0, village=None):
+    rng = np.random.default_rng(seed)
+    farm, water = tmp_path / f"farm{seed}.xlsx", tmp_path / f"water{seed}.csv"
+    codes = benchmark.generate_farm_workbook(farm, 4, 2, rng)
+    benchmark.generate_water_csv(water, codes, 12, rng, start=start)
+    processed = process_data(farm, water)
+    if village is not None:
+        # Each village's workbook has its own farms
+        processed['Farm ID'] = f"V{village}-" + processed['Farm ID'].astype(str)
+    return CompactDataset(processed)
+
+
+def test_past_season_round_trip(tmp_path):
+    root = tmp_path / "history"
+    dataset = season_dataset(tmp_path, "2023-06-15")
+    assert history.add_season(dataset, "upload", root=root) == "kharif-2023"
+    assert history.seasons(root) == ["kharif-2023"]
+
+    farm = dataset.farm_list[0]
+    readings = dataset.water_levels
+    readings = readings[(readings['Farm ID'] == farm) & ~readings['Flagged']]
+    expected = readings.groupby('Days from Sowing')['Water Level'].mean()
+
+    past = history.farm_history(farm, ["kharif-2023"], root=root)
+    np.testing.assert_allclose(past['Water Level'], expected.to_numpy(), rtol=1e-6)
+    assert list(past['Bucket']) == list(expected.index)
+
+
+def test_rewrite_publishes_a_new_version(tmp_path):
+    root = tmp_path / "history"
+    history.add_season(season_dataset(tmp_path, "2023-06-15", 0), "first", root=root)
+    first = history.farm_history("K24-00000", root=root)['Version'].iloc[0]
+
+    # Same upload again: nothing is rewritten
+    history.add_season(season_dataset(tmp_path, "2023-06-15", 0), "first", root=root)
+    assert history.farm_history("K24-00000", root=root)['Version'].iloc[0] == first
+
+    history.add_season(season_dataset(tmp_path, "2023-06-15", 1), "second", root=root)
+    second = history.farm_history("K24-00000", root=root)['Version'].iloc[0]
+    assert second != first
+
+    # One earlier version is kept for readers of the old index, no more
+    history.add_season(season_dataset(tmp_path, "2023-06-15", 2), "third", root=root)
+    versions = sorted(name for name in os.listdir(root) if name.startswith("kharif-2023."))
+    assert first not in versions and second in versions and len(versions) == 2
+
+
+def test_village_uploads_share_a_season(tmp_path):
+    root = tmp_path / "history"
+    for village in range(3):
+        history.add_season(season_dataset(tmp_path, "2023-06-15", village, village), f"village{village}", root=root)
+    assert history.seasons(root) == ["kharif-2023"]
+    for village in range(3):
+        assert not history.farm_history(f"V{village}-K24-00000", root=root).empty
+
+    # Uploading a village again replaces only that village's readings
+    before = history.farm_history("V1-K24-00000", root=root)
+    history.add_season(season_dataset(tmp_path, "2023-06-15", 7, 0), "village0 again", root=root)
+    again = history.farm_history("V0-K24-00000", root=root)
+    assert again['Version'].iloc[0] != history.farm_history("V1-K24-00000", root=root)['Version'].iloc[0]
+    assert history.farm_history("V1-K24-00000", root=root).equals(before)
+    uploads = history.load_index(root)["seasons"]["kharif-2023"]["uploads"]
+    assert [upload["source"] for upload in uploads] == ["village1", "village2", "village0 again"]
@@ -0,0 +1,33 @@
+import pandas as pd
+
+import data_cache
+from pipeline import process_data
+
+
+def first_rows(path, out, rows):
+    pd.read_csv(path, dtype=str).iloc[:rows].to_csv(out, index=False)
+    return out
+
+
+def test_append_matches_full_run(uploads, tmp_path):
+    farm, water = uploads
+    earlier = process_data(farm, first_rows(water, tmp_path / "earlier.csv", 10))
+    appended = process_data(farm, water, earlier)
+    full = process_data(farm, water)
+
+    assert list(appended.columns) == list(full.columns)
+    pd.testing.assert_frame_equal(appended.reset_index(drop=True), full.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_nothing_new_returns_previous(uploads):
+    farm, water = uploads
+    full = process_data(farm, water)
+    assert process_data(farm, water, full) is full
+
+
+def test_append_key_differs_from_plain_run(uploads):
+    farm, water = uploads
+    plain = data_cache.dataset_key(farm, water, [])
+    assert data_cache.dataset_key(farm, water, [], "earlier") != plain
+    assert data_cache.dataset_key(farm, water, [], "earlier") != data_cache.dataset_key(farm, water, [], "other")
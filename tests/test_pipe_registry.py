@@ -0,0 +1,14 @@
+import pandas as pd
+
+from pipe_registry import PipeRegistry, normalize_codes
+
+
+def test_normalize_matches_plain_normalization():
+    registry = PipeRegistry([" Sukh_1 ", "sukh_1", "Hardeep_10", None, ""])
+    assert registry.codes == ["Sukh_1", "sukh_1", "Hardeep_10"]
+    assert "Sukh_1" in registry and "Gill_1" not in registry
+
+    codes = pd.Series(["Sukh_1", " HARDEEP_10", "unknown_2 ", 101, None], dtype=object)
+    expected = normalize_codes(codes)
+    assert registry.normalize(codes).tolist() == expected.tolist()
+    assert expected.tolist()[:3] == ["sukh_1", "hardeep_10", "unknown_2"]
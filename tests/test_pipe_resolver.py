@@ -0,0 +1,40 @@
+from pipe_resolver import PipeCodeResolver
+
+LEVEL = " Water level in pipe from bottom up - in millimeter"
+
+
+def test_longest_code_wins():
+    resolver = PipeCodeResolver(["Hardeep_1", "Newhardeep_1", "hardeep_10"])
+    assert resolver.resolve("Newhardeep_1" + LEVEL) == "Newhardeep_1"
+    assert resolver.resolve("hardeep_10" + LEVEL) == "hardeep_10"
+    assert resolver.resolve("Hardeep_1" + LEVEL) == "Hardeep_1"
+
+
+def test_overlapping_codes_are_not_ambiguous():
+    resolver = PipeCodeResolver(["Hardeep_1", "Newhardeep_1", "hardeep_10"])
+    columns = ["Newhardeep_1" + LEVEL, "hardeep_10" + LEVEL, "Hardeep_1" + LEVEL]
+    resolved, ambiguous = resolver.resolve_columns(columns)
+    assert resolved == ["Newhardeep_1", "hardeep_10", "Hardeep_1"]
+    assert ambiguous == {}
+
+
+def test_unmatched_column_is_kept():
+    resolver = PipeCodeResolver(["Hardeep_1"])
+    assert resolver.resolve("Date") == "Date"
+
+
+def test_case_variants_are_one_pipe():
+    resolver = PipeCodeResolver(["sukh_1", "Sukh_1"])
+    # The spelling found verbatim in the name wins
+    assert resolver.resolve("Sukh_1" + LEVEL) == "Sukh_1"
+
+    resolved, ambiguous = resolver.resolve_columns(["SUKH_1" + LEVEL])
+    assert resolved == ["sukh_1"]
+    assert ambiguous == {}
+
+
+def test_different_codes_of_equal_length_are_reported():
+    resolver = PipeCodeResolver(["gill_1", "sidhu_2", "brar_1"])
+    resolved, ambiguous = resolver.resolve_columns(["gill_1 brar_1" + LEVEL])
+    assert resolved == ["gill_1"]
+    assert ambiguous == {"gill_1 brar_1" + LEVEL: ["gill_1", "brar_1"]}
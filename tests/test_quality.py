@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+import quality
+from pipeline import date_columns, process_data
+
+
+def steady(n, level=100.0, seed=0):
+    # Readings wobbling a few millimetres around one level
+    return level + np.random.default_rng(seed).uniform(-3, 3, n)
+
+
+def test_out_of_range_readings():
+    values = np.array([[10.0, -5.0, 150.0, 400.0, np.nan, 300.0]])
+    checks = quality.check_readings(values)
+    assert checks['Out of Range'].tolist() == [[False, True, False, True, False, False]]
+
+
+def test_outlier_is_a_jump_off_the_rolling_median():
+    values = steady(15)[None, :]
+    values[0, 7] = 200.0
+    values[0, 3] += 15  # within MIN_OUTLIER_MM of the median
+    checks = quality.check_readings(values)
+    assert np.flatnonzero(checks['Outlier'][0]).tolist() == [7]
+
+
+def test_flatline_runs_skip_gaps_and_zeros():
+    values = np.array([
+        [50.0, 50.0, np.nan, 50.0, 50.0, 50.0, 80.0],  # five in a row across a gap
+        [50.0, 50.0, 50.0, 50.0, 80.0, 50.0, 50.0],    # four, then two
+        [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 10.0],          # a dry pipe
+    ])
+    flat = quality.check_readings(values)['Flatline']
+    assert flat[0].tolist() == [True, True, False, True, True, True, False]
+    assert not flat[1:].any()
+
+
+def test_run_checks_returns_flags_in_column_order():
+    values = np.vstack([steady(10, seed=1), steady(10, seed=2)])
+    values[1, 2] = 500.0
+    dates = pd.date_range("2024-07-01", periods=10)
+    shuffled = np.random.default_rng(0).permutation(10)
+
+    report, flags = quality.run_checks(values[:, shuffled], dates[shuffled], ['F1', 'F1'], ['p1', 'p2'])
+    assert report[['Pipe Code', 'Readings', 'Out of Range', 'Flagged']].values.tolist() == [
+        ['p1', 10, 0, 0], ['p2', 10, 1, 1]]
+    assert np.argwhere(flags).tolist() == [[1, int(np.flatnonzero(shuffled == 2)[0])]]
+
+
+def test_quality_report_from_processed_frame(uploads):
+    farm, water = uploads
+    df = process_data(farm, water)
+    report = quality.quality_report(df)
+
+    assert len(report) == len(df.drop_duplicates(subset=['Farm ID', 'Pipe Code']))
+    assert list(report.columns) == ['Farm ID', 'Pipe Code', 'Readings', *quality.CHECKS, 'Flagged', 'Flagged Share']
+    labels, _ = date_columns(df.columns)
+    assert report['Readings'].sum() == df[labels].notna().sum().sum()
@@ -0,0 +1,32 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+import render_cache  # noqa: E402
+
+
+def png_width(png):
+    return int.from_bytes(png[16:20], 'big')
+
+
+def test_wide_figures_are_rendered_at_display_width():
+    fig, ax = plt.subplots(figsize=(20, 6))
+    ax.plot(range(10))
+    try:
+        png = render_cache.render_png(fig)
+    finally:
+        plt.close(fig)
+    assert png.startswith(b"\x89PNG")
+    assert 0 < png_width(png) <= render_cache.MAX_IMAGE_WIDTH
+
+
+def test_narrow_figures_keep_their_resolution():
+    fig, ax = plt.subplots(figsize=(4, 3))
+    ax.plot(range(10))
+    try:
+        png = render_cache.render_png(fig)
+    finally:
+        plt.close(fig)
+    assert png_width(png) < render_cache.MAX_IMAGE_WIDTH
@@ -0,0 +1,81 @@
+import gc
+
+import pytest
+
+import datasets
+from pipeline import process_data
+
+
+@pytest.fixture
+def processed(uploads):
+    farm, water = uploads
+    return process_data(farm, water)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    datasets.clear()
+    yield
+    datasets.clear()
+
+
+def keys():
+    return [entry['key'] for entry in datasets.entries()]
+
+
+def budget_for(dataset, count):
+    # MEMORY_BUDGET_MB that holds count datasets of this size, not count + 1
+    return dataset.total_bytes * (count + 0.5) / 1024 ** 2
+
+
+def test_unheld_datasets_are_evicted_least_recently_used_first(processed, monkeypatch):
+    first = datasets.share("a", processed)
+    monkeypatch.setattr(datasets, "MEMORY_BUDGET_MB", budget_for(first, 2))
+    datasets.share("b", processed)
+    assert datasets.get("a") is first  # now the most recently used
+    datasets.share("c", processed)
+    assert keys() == ["a", "c"]
+    assert datasets.stats()['evictions'] == 1
+
+
+def test_held_datasets_are_never_evicted(processed, monkeypatch):
+    monkeypatch.setattr(datasets, "MEMORY_BUDGET_MB", 0)
+    dataset = datasets.share("a", processed)
+    assert keys() == []  # nobody held it
+
+    ref = datasets.acquire("a", dataset)
+    datasets.share("b", processed)
+    assert keys() == ["a"]
+    assert datasets.stats()['sessions'] == 1
+
+    # Released datasets go on the next insert
+    ref.release()
+    assert keys() == ["a"]
+    datasets.share("b", processed)
+    assert keys() == []
+
+
+def test_dropped_refs_release_their_claim(processed, monkeypatch):
+    monkeypatch.setattr(datasets, "MEMORY_BUDGET_MB", 0)
+    dataset = datasets.share("a", processed)
+    ref = datasets.acquire("a", dataset)
+    other = datasets.acquire("a", dataset)
+    assert datasets.entries()[0]['sessions'] == 2
+
+    del ref
+    gc.collect()
+    assert datasets.entries()[0]['sessions'] == 1
+    other.release()
+    other.release()  # releasing twice counts once
+    assert datasets.entries()[0]['sessions'] == 0
+
+
+def test_refs_from_before_clear_leave_new_entries_alone(processed):
+    dataset = datasets.share("a", processed)
+    old = datasets.acquire("a", dataset)
+    datasets.clear()
+
+    new = datasets.acquire("a", datasets.share("a", processed))
+    old.release()
+    assert datasets.entries()[0]['sessions'] == 1
+    new.release()
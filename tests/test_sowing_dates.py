@@ -0,0 +1,46 @@
+import datetime
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import DEFAULT_SOWING_DATE, KHARIF_SHEET, PipelineWarning, parse_sowing_dates, process_data
+
+
+def test_each_row_uses_the_first_format_that_fits():
+    parsed = parse_sowing_dates(["15/06/2024", "2024-06-20", "06/25/2024", "21-06-2024", "03/06/2024"])
+    assert parsed.tolist() == [
+        pd.Timestamp(2024, 6, 15),
+        pd.Timestamp(2024, 6, 20),
+        pd.Timestamp(2024, 6, 25),  # no 25th month, so month first
+        pd.Timestamp(2024, 6, 21),
+        pd.Timestamp(2024, 6, 3),   # ambiguous: day first wins
+    ]
+
+
+def test_excel_date_cells_are_taken_as_they_are():
+    values = pd.Series([datetime.datetime(2024, 6, 12), datetime.date(2024, 6, 13),
+                        pd.Timestamp(2024, 6, 14), np.datetime64("2024-06-15")], dtype=object)
+    assert parse_sowing_dates(values).tolist() == list(pd.date_range("2024-06-12", periods=4))
+
+
+def test_padded_strings_and_unreadable_values():
+    values = pd.Series([" 15/06/2024 ", "2024-06-20\t", "not sown", None, np.nan, 45000], index=[5, 6, 7, 8, 9, 10])
+    parsed = parse_sowing_dates(values)
+    assert parsed.index.tolist() == [5, 6, 7, 8, 9, 10]
+    assert parsed.iloc[:2].tolist() == [pd.Timestamp(2024, 6, 15), pd.Timestamp(2024, 6, 20)]
+    assert parsed.iloc[2:].isna().all()
+
+
+def test_defaulted_rows_are_counted(uploads):
+    farm, water = uploads
+    kharif = pd.read_excel(farm, sheet_name=KHARIF_SHEET)
+    unreadable = set(kharif.loc[kharif.iloc[:, 1].astype(str) == "not sown", kharif.columns[0]])
+
+    with pytest.warns(PipelineWarning, match="no readable sowing date") as record:
+        df = process_data(farm, water)
+    [message] = [str(w.message) for w in record if "sowing date" in str(w.message)]
+    defaulted = df['Farm ID'].isin(unreadable)
+    assert int(re.match(r"(\d+) pipe row", message).group(1)) == defaulted.sum() > 0
+    assert (df.loc[defaulted, 'Date of Sowing'] == DEFAULT_SOWING_DATE).all()
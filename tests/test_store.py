@@ -0,0 +1,38 @@
+import pytest
+
+import store
+from pipeline import process_data
+
+
+def village_frame(processed, village):
+    # Each village's workbook has its own farms
+    return processed.assign(**{
+        'Location': f"Village {village}",
+        'Farm ID': f"V{village}-" + processed['Farm ID'].astype(str),
+    })
+
+
+def test_store_replaces_only_reuploads_of_the_same_farms(tmp_path, uploads):
+    farm, water = uploads
+    processed = process_data(farm, water)
+    root = str(tmp_path / "store")
+
+    for village in range(5):
+        assert store.write_dataset(village_frame(processed, village), f"ds{village}", root=root) == "kharif-2024"
+    assert store.list_datasets(root) == ["ds0", "ds1", "ds2", "ds3", "ds4"]
+
+    # Uploading village 0 again (or appending to it) supersedes its first copy
+    store.write_dataset(village_frame(processed, 0), "ds0 again", root=root)
+    assert store.list_datasets(root) == ["ds0 again", "ds1", "ds2", "ds3", "ds4"]
+    with pytest.raises(FileNotFoundError):
+        store.load("ds0", root=root)
+
+    # An upload covering only some of a dataset's farms leaves it in place
+    partial = village_frame(processed, 1)
+    store.write_dataset(partial[partial['Farm ID'] == partial['Farm ID'].iloc[0]], "ds1 part", root=root)
+    assert "ds1" in store.list_datasets(root)
+
+    # Another season's uploads are separate
+    store.write_dataset(village_frame(processed, 2), "rabi", root=root, season="rabi-2024")
+    assert "ds2" in store.list_datasets(root)
+    assert len(store.load("ds2", root=root)) == len(store.load("rabi", root=root))
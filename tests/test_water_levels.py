@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+import benchmark
+import datasets
+from pipeline import build_water_levels, date_columns, process_data
+
+
+def test_date_columns_skip_identifiers():
+    labels, dates = date_columns(['Pipe Code', '2023-07-01', 'Farm ID', 'Date of Sowing', 'Location', '2023-07-02'])
+    assert labels == ['2023-07-01', '2023-07-02']
+    assert list(dates) == [pd.Timestamp(2023, 7, 1), pd.Timestamp(2023, 7, 2)]
+
+
+def test_other_seasons_are_melted(tmp_path):
+    rng = np.random.default_rng(1)
+    farm, water = tmp_path / "farm.xlsx", tmp_path / "water.csv"
+    codes = benchmark.generate_farm_workbook(farm, 4, 2, rng)
+    benchmark.generate_water_csv(water, codes, 5, rng, start="2023-06-15")
+
+    water_levels = build_water_levels(process_data(farm, water))
+    assert not water_levels.empty
+    assert water_levels['Date'].dt.year.eq(2023).all()
+
+
+def test_no_dated_columns_gives_empty_table():
+    df = pd.DataFrame({
+        'Pipe Code': ['a_1'], 'Farm ID': ['F1'], 'Location': ['V'],
+        'Date of Sowing': [pd.Timestamp(2024, 6, 16)],
+    })
+    water_levels = build_water_levels(df)
+    assert water_levels.empty
+    assert list(water_levels.columns) == ['Farm ID', 'Pipe Code', 'Date', 'Days from Sowing',
+                                          'Water Level', 'Date of Sowing']
+
+    dataset = datasets.CompactDataset(df)
+    assert dataset.water_levels.empty
+    assert dataset.farm_list == ['F1']